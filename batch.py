@@ -0,0 +1,149 @@
+"""
+run many transit and secondary eclipse spectra in a process pool
+"""
+import collections
+import multiprocessing
+import numpy as np 
+from read_data import TransitData, EmergentData
+from spectra import TransitSpectra, SecondarySpectra
+from results_store import TABLE_PARAMETERS
+
+def run_job(job,seed):
+	"""
+	job: dict with 'kind' ('transit' or 'secondary'), 'file_path' (or a
+	     TransitData/EmergentData), an optional 'seed_group' (see
+	     seed_indices) and the remaining keyword arguments of the Compute
+	     method, an 'rng' among them replaces seed
+	seed: SeedSequence of the job
+	return binned_wavelength, mean, sigma
+	"""
+	kwargs = dict(job)
+	kind = kwargs.pop('kind')
+	file_path = kwargs.pop('file_path')
+	kwargs.pop('seed_group',None)
+	kwargs.setdefault('rng',seed)
+	if kind == 'transit':
+		spectra = TransitSpectra()
+		spectra.Compute(file_path,**kwargs)
+		return spectra.binned_wavelength, spectra.mean_depth, spectra.sigma
+	elif kind == 'secondary':
+		spectra = SecondarySpectra()
+		spectra.Compute(file_path,**kwargs)
+		return spectra.binned_wavelength, spectra.mean_ratio, spectra.sigma
+	raise ValueError("job kind must be 'transit' or 'secondary', got %r" % (kind,))
+
+def _run_indexed_job(args):
+	index, job, seed = args
+	return index, run_job(job,seed)
+
+def job_seed(seed,index):
+	"""
+	SeedSequence of job index, the same as SeedSequence(seed).spawn(n)[index]
+	so any subset of the jobs can be rerun with the noise of a full run
+	"""
+	return np.random.SeedSequence(seed,spawn_key=(index,))
+
+def seed_indices(jobs):
+	"""
+	index of the noise stream of every job: its own index, or the index of
+	the first job with the same 'seed_group', so the jobs of a group draw the
+	same random numbers and their differences are free of sampling noise
+	(common random numbers). jobs without a seed_group get their own stream
+	"""
+	first = {}
+	return [i if job.get('seed_group') is None else first.setdefault(job['seed_group'],i) \
+		for i,job in enumerate(jobs)]
+
+def share_inputs(jobs):
+	"""
+	read every input file used by more than one job once and publish it in
+	shared memory, the workers then attach to it instead of reading the file
+	return the jobs with these file paths replaced by the published data
+	objects, and the list of published objects
+	"""
+	counts = collections.Counter((job['kind'],job['file_path']) for job in jobs \
+		if isinstance(job['file_path'],str))
+	shared = {}
+	for (kind,file_path),count in counts.items():
+		if count > 1:
+			data = TransitData() if kind == 'transit' else EmergentData()
+			data.Read(file_path)
+			shared[kind,file_path] = data.Publish()
+	tasks = []
+	for job in jobs:
+		key = (job['kind'],job['file_path'])
+		if isinstance(job['file_path'],str) and key in shared:
+			job = dict(job,file_path=shared[key])
+		tasks.append(job)
+	return tasks, list(shared.values())
+
+def iter_batch(jobs,seeds,n_workers=None,share=True):
+	"""
+	compute every job with its seed on a pool of n_workers processes
+	(all cores by default, inline when n_workers is 1)
+	share: pass input files used by several jobs to the workers through
+	       shared memory (see share_inputs), released when the batch ends
+	yield (index, result) of each job as soon as it finishes
+	"""
+	if n_workers == 1:
+		for i,(job,seed) in enumerate(zip(jobs,seeds)):
+			yield _run_indexed_job((i,job,seed))
+		return
+	published = []
+	pool = None
+	try:
+		if share:
+			jobs, published = share_inputs(jobs)
+		tasks = [(i,job,seed) for i,(job,seed) in enumerate(zip(jobs,seeds))]
+		pool = multiprocessing.Pool(n_workers)
+		for result in pool.imap_unordered(_run_indexed_job,tasks,chunksize=1):
+			yield result
+	finally:
+		if pool is not None:
+			pool.terminate()
+			pool.join()
+		for data in published:
+			data.Release()
+
+def run_batch(jobs,n_workers=None,seed=None):
+	"""
+	compute every job on a pool of n_workers processes (all cores by default)
+
+	each job draws its noise from its own child of SeedSequence(seed), shared
+	by the jobs of one 'seed_group' (see seed_indices), so the results only
+	depend on seed and on the order of jobs, not on n_workers or on the
+	scheduling
+
+	return a structured array with one row per job and binned wavelength,
+	with fields job, kind, file_path, the TABLE_PARAMETERS (nan when not
+	given), wavelength, mean and sigma
+	"""
+	jobs = list(jobs)
+	entropy = np.random.SeedSequence(seed).entropy
+	seeds = [job_seed(entropy,index) for index in seed_indices(jobs)]
+	results = dict(iter_batch(jobs,seeds,n_workers))
+	return make_table(jobs,[results[i] for i in range(len(jobs))])
+
+def make_table(jobs,results):
+	"""
+	gather (binned_wavelength, mean, sigma) of each job into one structured array
+	"""
+	path_length = max([len(str(job['file_path'])) for job in jobs] + [1])
+	dtype = [('job',np.int64),('kind','U9'),('file_path','U%d' % path_length)]
+	dtype += [(name,np.float64) for name in TABLE_PARAMETERS]
+	dtype += [('wavelength',np.float64),('mean',np.float64),('sigma',np.float64)]
+	n_rows = sum(len(result[0]) for result in results)
+	table = np.zeros(n_rows,dtype=dtype)
+	row = 0
+	for i,(job,(binned_wavelength,mean,sigma)) in enumerate(zip(jobs,results)):
+		rows = slice(row,row+len(binned_wavelength))
+		table['job'][rows] = i
+		table['kind'][rows] = job['kind']
+		table['file_path'][rows] = job['file_path']
+		for name in TABLE_PARAMETERS:
+			table[name][rows] = job.get(name,np.nan)
+		table['wavelength'][rows] = binned_wavelength
+		table['mean'][rows] = mean
+		table['sigma'][rows] = sigma
+		row = rows.stop
+	return table
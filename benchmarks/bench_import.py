@@ -0,0 +1,79 @@
+"""
+time the import of the compute modules in fresh interpreters and check that
+none of them pulls in plotting or other heavy optional packages; exits with
+status 1 when a forbidden module is imported or an import is slower than
+--max-time
+
+usage:
+python benchmarks/bench_import.py
+python benchmarks/bench_import.py --repeat 10 --max-time 1.0 --output bench_import.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+sys.path.insert(0,REPO)
+from bench_pipeline import version_info
+
+# modules making up the compute path
+MODULES = ('spectra','noise_engine','binned_photon_energy','read_data','flux_cache','batch','cli','results_store')
+# modules only needed for plotting or as optional accelerators
+FORBIDDEN = ('matplotlib','pandas','scipy.stats','h5py','yaml')
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+json.dump(dict(time=elapsed,modules=sorted(sys.modules)),sys.stdout)
+'''
+
+def time_import(module):
+	"""
+	import module in a new interpreter
+	return the import time (s) and the names of all loaded modules
+	"""
+	output = subprocess.check_output([sys.executable,'-c',PROBE % module],cwd=REPO)
+	result = json.loads(output.decode())
+	return result['time'], result['modules']
+
+def bench_module(module,repeat):
+	times = []
+	for i in range(repeat):
+		elapsed, modules = time_import(module)
+		times.append(elapsed)
+	forbidden = [package for package in FORBIDDEN \
+		if any(name == package or name.startswith(package + '.') for name in modules)]
+	return dict(module=module,import_time=min(times),median_time=sorted(times)[len(times)//2],\
+		n_modules=len(modules),forbidden=forbidden)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--modules',nargs='+',default=list(MODULES),help='modules to import')
+	parser.add_argument('--repeat',type=int,default=5,help='fresh interpreters per module, the best is kept')
+	parser.add_argument('--max-time',type=float,default=None,help='fail when an import takes longer (s)')
+	parser.add_argument('--output',default=None,help='JSON file to write')
+	args = parser.parse_args(argv)
+
+	records = [bench_module(module,args.repeat) for module in args.modules]
+	failed = False
+	for record in records:
+		status = 'ok'
+		if record['forbidden']:
+			status = 'imports ' + ', '.join(record['forbidden'])
+			failed = True
+		elif args.max_time is not None and record['import_time'] > args.max_time:
+			status = 'slower than %g s' % args.max_time
+			failed = True
+		print('%-22s %8.3f s %5d modules  %s' % (record['module'],record['import_time'],record['n_modules'],status))
+	if args.output:
+		with open(args.output,'w') as f:
+			json.dump(dict(version=version_info(),records=records),f,indent=1)
+		print('results written to %s' % args.output)
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+benchmark every stage of the transit and secondary eclipse pipeline on
+synthetic input files, reporting wall time, cpu time, throughput and peak
+memory as JSON so versions can be compared
+
+usage:
+python benchmarks/bench_pipeline.py --output bench.json
+python benchmarks/bench_pipeline.py --rows 1000 100000 --instances 10 1000 --output new.json --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np 
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+sys.path.insert(0,REPO)
+from read_data import TransitData, EmergentData
+from star import Star
+import binned_photon_energy
+from binned_photon_energy import Binning, BinnedJWSTBackgroundPhotonEnergy
+from detector_noise import DetectorNoise
+from sys_noise import SysNoise
+from noise_engine import NoiseEngine
+from spectra import simulate_ratio
+
+# observing parameters of work_dir/main.py
+d = 5
+t = 11000
+R = 100
+tau = 0.5
+R_p = 7e+7
+A_tel = 25
+n_ints = 20
+noise_floor = [20.e-6,30.e-6,50.e-6]
+binned_wavelength_min = 2.
+binned_wavelength_max = 11.
+
+def write_synthetic_files(directory,n_rows):
+	"""
+	write a transit and an emergent spectra of n_rows rows, wavelength descending
+	from 30 to 0.5 micron as in the model atmosphere files
+	return the two paths
+	"""
+	wavelength = np.logspace(np.log10(30.),np.log10(0.5),n_rows)
+	depth = 0.0104 + 1e-4*np.sin(5*wavelength)
+	flux = 1e-3/wavelength + 1e-4*np.cos(3*wavelength)**2
+	transit_path = os.path.join(directory,'transit_%d.txt' % n_rows)
+	emergent_path = os.path.join(directory,'emergent_%d.txt' % n_rows)
+	np.savetxt(transit_path,np.column_stack((wavelength,depth)))
+	np.savetxt(emergent_path,np.column_stack((wavelength,flux)))
+	return transit_path, emergent_path
+
+def measure(stage,function,work,repeat=1,memory=True,**info):
+	"""
+	time function() (best of repeat), then run it once more under tracemalloc
+	for the peak memory
+	work: number of items processed, for the throughput
+	return the result of function and the record
+	"""
+	wall_time = cpu_time = float('inf')
+	for i in range(repeat):
+		wall_start, cpu_start = time.perf_counter(), time.process_time()
+		result = function()
+		wall_time = min(wall_time,time.perf_counter() - wall_start)
+		cpu_time = min(cpu_time,time.process_time() - cpu_start)
+	record = dict(stage=stage,wall_time=wall_time,cpu_time=cpu_time,work=work,\
+		throughput=work/wall_time if wall_time > 0 else None,peak_memory=None)
+	if memory:
+		tracemalloc.start()
+		function()
+		record['peak_memory'] = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	record.update(info)
+	print('%-22s %12.6f s %14.4g items/s %s' % (stage,wall_time,record['throughput'] or 0,\
+		' '.join('%s=%s' % item for item in sorted(info.items()))))
+	return result, record
+
+def bench_rows(directory,n_rows,repeat,memory):
+	"""
+	stages whose cost scales with the number of rows of the input files
+	"""
+	records = []
+	transit_path, emergent_path = write_synthetic_files(directory,n_rows)
+	info = dict(n_rows=n_rows)
+	def read_transit():
+		transit_data = TransitData()
+		transit_data.Read(transit_path)
+		return transit_data
+	def read_emergent():
+		emergent_data = EmergentData()
+		emergent_data.Read(emergent_path)
+		return emergent_data
+	transit_data, record = measure('TransitData.Read',read_transit,n_rows,repeat,memory,**info)
+	records.append(record)
+	emergent_data, record = measure('EmergentData.Read',read_emergent,n_rows,repeat,memory,**info)
+	records.append(record)
+	star = Star()
+	L_star, record = measure('Star.BlackBodySpectra',lambda: star.BlackBodySpectra(transit_data.wavelength),\
+		n_rows,repeat,memory,**info)
+	records.append(record)
+	def build_binning():
+		# time the construction of the weights, not the cache lookup
+		binned_photon_energy._weight_cache.clear()
+		return Binning(transit_data.wavelength,binned_wavelength_min,binned_wavelength_max,R)
+	binning_obj, record = measure('Binning.__init__',build_binning,n_rows,repeat,memory,**info)
+	records.append(record)
+	f_in_transit = L_star*(1-transit_data.depth)
+	binned, record = measure('Binning.binning',lambda: binning_obj.binning(f_in_transit),n_rows,repeat,memory,**info)
+	records.append(record)
+	return records
+
+def bench_noise(n_instances,chunk_size,repeat,memory):
+	"""
+	stages on the binned grid, whose cost scales with n_instance
+	"""
+	records = []
+	wavelength = np.logspace(np.log10(binned_wavelength_min),np.log10(binned_wavelength_max),\
+		int(np.log(binned_wavelength_max/binned_wavelength_min)*R))
+	n_bins = wavelength.size
+	info = dict(n_bins=n_bins)
+	bkg_obj, record = measure('background',lambda: BinnedJWSTBackgroundPhotonEnergy(wavelength,R,t),n_bins,repeat,memory,**info)
+	records.append(record)
+	detector_noise, record = measure('detector_noise',lambda: DetectorNoise(wavelength,R,n_ints),n_bins,repeat,memory,**info)
+	records.append(record)
+	sys_noise, record = measure('systematic_noise',lambda: SysNoise(wavelength,noise_floor),n_bins,repeat,memory,**info)
+	records.append(record)
+	# photon numbers of the order of the main.py observation
+	n_star = np.full(n_bins,1e9)
+	n_in_transit = n_star*(1-0.0104)
+	for n_instance in n_instances:
+		info = dict(n_bins=n_bins,n_instance=n_instance,chunk_size=chunk_size)
+		star_engine = NoiseEngine(n_star,bkg_obj.n_background,detector_noise,sys_noise,0)
+		planet_engine = NoiseEngine(n_in_transit,bkg_obj.n_background,detector_noise,sys_noise,1)
+		out = np.empty((min(n_instance,chunk_size),n_bins))
+		def generate():
+			for start in range(0,n_instance,chunk_size):
+				n = min(chunk_size,n_instance-start)
+				star_engine.generate(n,out=out[:n])
+		result, record = measure('NoiseEngine.generate',generate,n_instance*n_bins,repeat,memory,**info)
+		records.append(record)
+		def statistics():
+			return simulate_ratio(star_engine,planet_engine,bkg_obj.n_background,n_instance,True,chunk_size)
+		result, record = measure('statistics',statistics,n_instance*n_bins,repeat,memory,**info)
+		records.append(record)
+		def statistics_float32():
+			return simulate_ratio(star_engine,planet_engine,bkg_obj.n_background,n_instance,True,chunk_size,dtype=np.float32)
+		result, record = measure('statistics_float32',statistics_float32,n_instance*n_bins,repeat,memory,**info)
+		records.append(record)
+	return records
+
+def version_info():
+	try:
+		revision = subprocess.check_output(['git','rev-parse','HEAD'],cwd=REPO,stderr=subprocess.STDOUT).decode().strip()
+	except (OSError,subprocess.CalledProcessError):
+		revision = None
+	return dict(revision=revision,python=platform.python_version(),numpy=np.__version__,\
+		platform=platform.platform(),time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+def compare(records,baseline_path):
+	"""
+	print the wall time of every stage relative to a previous JSON output
+	"""
+	def key(record):
+		return (record['stage'],) + tuple(sorted((name,value) for name,value in record.items() \
+			if name in ('n_rows','n_bins','n_instance','chunk_size')))
+	with open(baseline_path) as f:
+		baseline = dict((key(record),record) for record in json.load(f)['records'])
+	print('wall time relative to %s' % baseline_path)
+	for record in records:
+		if key(record) in baseline:
+			ratio = record['wall_time']/baseline[key(record)]['wall_time']
+			print('%-22s %8.3f %s' % (record['stage'],ratio,' '.join('%s=%s' % item for item in key(record)[1:])))
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--rows',type=int,nargs='+',default=[10**3,10**4,10**5,10**6,10**7],\
+		help='number of rows of the synthetic input files')
+	parser.add_argument('--instances',type=int,nargs='+',default=[10,10**2,10**3,10**4,10**5,10**6],\
+		help='values of n_instance')
+	parser.add_argument('--chunk-size',type=int,default=10000,help='realizations held in memory at once')
+	parser.add_argument('--repeat',type=int,default=3,help='timing runs per stage, the best is kept')
+	parser.add_argument('--no-memory',action='store_true',help='skip the tracemalloc peak memory runs')
+	parser.add_argument('--output',default='bench_pipeline.json',help='JSON file to write')
+	parser.add_argument('--compare',help='previous JSON output to compare the wall times against')
+	args = parser.parse_args(argv)
+
+	directory = tempfile.mkdtemp(prefix='spectra_bench_')
+	records = []
+	try:
+		for n_rows in args.rows:
+			records += bench_rows(directory,n_rows,args.repeat,not args.no_memory)
+	finally:
+		shutil.rmtree(directory)
+	records += bench_noise(args.instances,args.chunk_size,args.repeat,not args.no_memory)
+	with open(args.output,'w') as f:
+		json.dump(dict(version=version_info(),records=records),f,indent=1)
+	print('results written to %s' % args.output)
+	if args.compare:
+		compare(records,args.compare)
+
+if __name__ == '__main__':
+	main()
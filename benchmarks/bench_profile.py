@@ -0,0 +1,55 @@
+"""
+run the transit and secondary eclipse pipelines under a memory tracing
+StageProfiler and print the stage report; exits with status 1 when a stage
+reports a lower peak memory than one of its nested stages
+
+usage:
+python benchmarks/bench_profile.py
+python benchmarks/bench_profile.py --rows 100000 --instances 10000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+sys.path.insert(0,REPO)
+from bench_pipeline import write_synthetic_files, d, t, R, tau, R_p, A_tel, n_ints, noise_floor, \
+	binned_wavelength_min, binned_wavelength_max
+from profiling import StageProfiler
+from spectra import TransitSpectra, SecondarySpectra
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--rows',type=int,default=10**5,help='number of rows of the synthetic input files')
+	parser.add_argument('--instances',type=int,default=10**4,help='value of n_instance')
+	parser.add_argument('--chunk-size',type=int,default=1000,help='realizations held in memory at once')
+	args = parser.parse_args(argv)
+
+	directory = tempfile.mkdtemp(prefix='spectra_profile_')
+	failed = False
+	try:
+		transit_path, emergent_path = write_synthetic_files(directory,args.rows)
+		for name,compute in (('transit',lambda profiler: TransitSpectra().Compute(transit_path,d,A_tel,tau,R,\
+				noise_floor,binned_wavelength_min,binned_wavelength_max,n_ints,t,args.instances,rng=0,\
+				chunk_size=args.chunk_size,cache=False,profiler=profiler)),\
+			('secondary',lambda profiler: SecondarySpectra().Compute(emergent_path,d,R_p,A_tel,tau,R,\
+				noise_floor,binned_wavelength_min,binned_wavelength_max,n_ints,t,args.instances,rng=0,\
+				chunk_size=args.chunk_size,cache=False,profiler=profiler))):
+			profiler = StageProfiler(trace_memory=True)
+			compute(profiler)
+			print(name)
+			for record in profiler.report.records:
+				print('  %-22s %-12s peak %12d bytes' % (record.name,record.parent or '',record.peak_bytes))
+			try:
+				profiler.report.check()
+			except ValueError as error:
+				print('  FAILED: %s' % error)
+				failed = True
+	finally:
+		shutil.rmtree(directory)
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
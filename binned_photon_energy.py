@@ -1,40 +1,131 @@
 """
 This module computes binned flux from source, background and instruments noise
 """
+import collections
+import hashlib
 import numpy as np 
-from scipy import interpolate
+from scipy import sparse
+import instrument
 
 h = 6.626e-34
 c = 3.0e8
 
+# weight matrices of recently used (input grid, output grid) pairs
+_weight_cache = collections.OrderedDict()
+_weight_cache_size = 32
+
 class Binning:
 	"""
 	binning the spectra according to the spectra resolution
 	"""
-	def __init__(self,wavelength,binned_wavelength_min,binned_wavelength_max,R):
+	def __init__(self,wavelength,binned_wavelength_min,binned_wavelength_max,R,mode='interpolate'):
+		"""
+		mode: 'interpolate' samples the spectra at the binned wavelength by linear interpolation,
+		      'average' averages the spectra over each bin, conserving the flux,
+		      every bin must then lie within the input wavelength
+		"""
 		self.wavelength = wavelength
-		N = np.int(np.log(binned_wavelength_max/binned_wavelength_min)*R)
+		N = int(np.log(binned_wavelength_max/binned_wavelength_min)*R)
 		self.binned_wavelength = np.logspace(np.log10(binned_wavelength_min),np.log10(binned_wavelength_max),N)
+		self.weights = self.weight_matrix(wavelength,self.binned_wavelength,mode)
 
 	def binning(self,flux):
-		f = interpolate.interp1d(self.wavelength[::-1],flux[::-1])
-		return f(self.binned_wavelength)
+		"""
+		flux: array of shape (n_wavelength,) or (n_spectra, n_wavelength)
+		return the binned flux of shape (n_bins,) or (n_spectra, n_bins)
+		"""
+		if flux.ndim == 1:
+			return self.weights.dot(flux)
+		return np.ascontiguousarray(self.weights.dot(flux.T).T)
+
+	@staticmethod
+	def weight_matrix(wavelength,binned_wavelength,mode):
+		"""
+		sparse (n_bins, n_wavelength) matrix mapping a spectra on the input
+		wavelength grid to the binned wavelength grid, cached per grid pair
+		"""
+		key = (mode,wavelength.size,hashlib.sha1(np.ascontiguousarray(wavelength)).hexdigest(),\
+			binned_wavelength.size,binned_wavelength[0],binned_wavelength[-1])
+		if key in _weight_cache:
+			_weight_cache.move_to_end(key)
+			return _weight_cache[key]
+		if mode == 'interpolate':
+			weights = Binning.interpolation_weights(wavelength,binned_wavelength)
+		elif mode == 'average':
+			weights = Binning.average_weights(wavelength,binned_wavelength)
+		else:
+			raise ValueError("mode must be 'interpolate' or 'average'")
+		_weight_cache[key] = weights
+		while len(_weight_cache) > _weight_cache_size:
+			_weight_cache.popitem(last=False)
+		return weights
+
+	@staticmethod
+	def interpolation_weights(wavelength,binned_wavelength):
+		# linear interpolation between the two neighbouring input points
+		order = np.argsort(wavelength,kind='stable')
+		x = wavelength[order]
+		if binned_wavelength[0] < x[0] or binned_wavelength[-1] > x[-1]:
+			raise ValueError('binned wavelength is outside the range of the input wavelength')
+		j = np.clip(np.searchsorted(x,binned_wavelength,side='right')-1,0,x.size-2)
+		w = (binned_wavelength - x[j])/(x[j+1] - x[j])
+		rows = np.arange(binned_wavelength.size)
+		return sparse.csr_matrix((np.concatenate((1-w,w)),(np.concatenate((rows,rows)),\
+			np.concatenate((order[j],order[j+1])))),shape=(binned_wavelength.size,wavelength.size))
+
+	@staticmethod
+	def average_weights(wavelength,binned_wavelength):
+		# overlap of every input pixel with every bin, normalized by the covered bin width
+		order = np.argsort(wavelength,kind='stable')
+		x = wavelength[order]
+		edges = Binning.pixel_edges(x)
+		# bins are log spaced, their edges are the geometric midpoints
+		binned_edges = np.exp(Binning.pixel_edges(np.log(binned_wavelength)))
+		all_edges = np.union1d(edges,binned_edges)
+		middle = 0.5*(all_edges[1:] + all_edges[:-1])
+		length = np.diff(all_edges)
+		pixel = np.searchsorted(edges,middle) - 1
+		binned = np.searchsorted(binned_edges,middle) - 1
+		valid = (pixel >= 0) & (pixel < x.size) & (binned >= 0) & (binned < binned_wavelength.size)
+		weights = sparse.csr_matrix((length[valid],(binned[valid],order[pixel[valid]])),\
+			shape=(binned_wavelength.size,wavelength.size))
+		covered = np.asarray(weights.sum(axis=1)).ravel()
+		# a partly covered bin would average only the flux that happens to be on the grid
+		partial = covered < (1 - 1e-9)*np.diff(binned_edges)
+		if np.any(partial):
+			raise ValueError('%d bins extend beyond the input wavelength (%g to %g micron), average binning '\
+				'needs every bin fully covered' % (partial.sum(),edges[0],edges[-1]))
+		return sparse.diags(1./covered).dot(weights).tocsr()
+
+	@staticmethod
+	def pixel_edges(x):
+		# edges halfway between sorted points, the outer edges extrapolate the spacing
+		middle = 0.5*(x[1:] + x[:-1])
+		return np.concatenate(([2*x[0] - middle[0]],middle,[2*x[-1] - middle[-1]]))
 
 class BinnedTransitPhotonNumber:
 	"""
 	compute the binned photon number for transit observations
 	"""
-	def __init__(self,binned_wavelength_min,binned_wavelength_max,transit_flux,R,tau,A_tel,t):
+	def __init__(self,binned_wavelength_min,binned_wavelength_max,transit_flux,R,tau,A_tel,t,binned_flux=None):
+		"""
+		binned_flux: optional (binned_wavelength, f_star_bin, f_in_transit_bin) already
+		             binned, e.g. from flux_cache, transit_flux is then not used
+		"""
+		if binned_flux is None:
+			binning_obj = Binning(transit_flux.wavelength,binned_wavelength_min,binned_wavelength_max,R)
+			self.binned_wavelength = binning_obj.binned_wavelength
+			f_star_bin = binning_obj.binning(transit_flux.f_star)
+			f_in_transit_bin = binning_obj.binning(transit_flux.f_in_transit) 
+		else:
+			self.binned_wavelength, f_star_bin, f_in_transit_bin = binned_flux
 		# convert to meters
-		binning_obj = Binning(transit_flux.wavelength,binned_wavelength_min,binned_wavelength_max,R)
-		self.binned_wavelength = binning_obj.binned_wavelength
-		f_star_bin = binning_obj.binning(transit_flux.f_star)
-		f_in_transit_bin = binning_obj.binning(transit_flux.f_in_transit) 
 		binned_wavelength = self.binned_wavelength*1e-6
 		self.n_star_bin = self.source_photon_number_eqn(binned_wavelength,f_star_bin,R,tau,A_tel)*t
 		self.n_in_transit_bin = self.source_photon_number_eqn(binned_wavelength,f_in_transit_bin,R,tau,A_tel)*t
 
-	def source_photon_number_eqn(self,wavelength, F, R, tau, A_tel):
+	@staticmethod
+	def source_photon_number_eqn(wavelength, F, R, tau, A_tel):
 		# Source returns the number of photons in each wavelength bin 
 		# F: flux 
 		# t: integration time
@@ -49,17 +140,25 @@ class BinnedSecondaryPhotonNumber:
 	"""
 	compute the binned photon number for secondary eclipse observations
 	"""
-	def __init__(self,binned_wavelength_min,binned_wavelength_max,secondary_flux,R,tau,A_tel,t):
+	def __init__(self,binned_wavelength_min,binned_wavelength_max,secondary_flux,R,tau,A_tel,t,binned_flux=None):
+		"""
+		binned_flux: optional (binned_wavelength, f_star_bin, f_out_transit_bin) already
+		             binned, e.g. from flux_cache, secondary_flux is then not used
+		"""
+		if binned_flux is None:
+			binning_obj = Binning(secondary_flux.wavelength,binned_wavelength_min,binned_wavelength_max,R)
+			self.binned_wavelength = binning_obj.binned_wavelength
+			f_star_bin = binning_obj.binning(secondary_flux.f_star)
+			f_out_transit_bin = binning_obj.binning(secondary_flux.f_out_transit) 
+		else:
+			self.binned_wavelength, f_star_bin, f_out_transit_bin = binned_flux
 		# convert to meters
-		binning_obj = Binning(secondary_flux.wavelength,binned_wavelength_min,binned_wavelength_max,R)
-		self.binned_wavelength = binning_obj.binned_wavelength
-		f_star_bin = binning_obj.binning(secondary_flux.f_star)
-		f_out_transit_bin = binning_obj.binning(secondary_flux.f_out_transit) 
 		binned_wavelength = self.binned_wavelength*1e-6
 		self.n_star_bin = self.source_photon_number_eqn(binned_wavelength,f_star_bin,R,tau,A_tel)*t
 		self.n_out_transit_bin = self.source_photon_number_eqn(binned_wavelength,f_out_transit_bin,R,tau,A_tel)*t
 
-	def source_photon_number_eqn(self,wavelength, F, R, tau, A_tel):
+	@staticmethod
+	def source_photon_number_eqn(wavelength, F, R, tau, A_tel):
 		# Source returns the number of photons in each wavelength bin 
 		# F: flux 
 		# t: integration time
@@ -74,12 +173,12 @@ class BinnedJWSTBackgroundPhotonEnergy:
 	"""
 
 	"""
-	def __init__(self,wavelength,R,t):
+	def __init__(self,wavelength,R,t,instrument_table=None):
 		self.wavelength = wavelength
-		self.n_background = self.JWST_Bkg_flux(self.wavelength,R)*t 
+		self.n_background = self.JWST_Bkg_flux(self.wavelength,R,instrument_table)*t 
 
 	# utility functions
-	def JWST_Bkg_flux(self,wavelength,R):
+	def JWST_Bkg_flux(self,wavelength,R,instrument_table=None):
 		"""
 		for a given wavelength, return a background flux
 		four modes specifically corresponds to JWST transit observations 
@@ -111,52 +210,18 @@ class BinnedJWSTBackgroundPhotonEnergy:
 		F1000W (8.8 - 11 micron): B = 2972.29 e/s/arcsec^2  
 		sum of these values to represent bkg for LRS prism
 		
+		the values above are the rows of instrument.JWST_MODES
+		instrument_table: InstrumentTable to use instead of instrument.JWST
+		
 		wavlength must be a numpy array object
-		R is the spectra resolution
+		R is the spectra resolution, scalar or broadcastable against wavelength
 		return the background photon flux in each spectra bin
 		"""
-		n = len(wavelength)
-		bkg = np.zeros(n)
-
-		# For NIRISS, bright SOSS mode, GR700XD optics
-		index_1 = np.nonzero(np.logical_and(wavelength>=1, wavelength < 2.5))
-		B1 = 197.30
-		B2 = 237.24
-		B3 = 193.07
-		B_GR700XD = B1 + B2 + B3
-		A_pix_NIRISS = 0.065*0.065
-		n_pix_NIRISS = 25*2
-		R_native_NIRISS = 700
-		bkg[index_1] = self.bkg_flux_eqn(B_GR700XD,A_pix_NIRISS,n_pix_NIRISS,R_native_NIRISS,R)
-
-		# for NIRCam, LW grism mode, F322W2 optics and LW grism, F444W
-		index_2 = np.nonzero(np.logical_and(wavelength>=2.5, wavelength < 3.9))
-		index_3 = np.nonzero(np.logical_and(wavelength>=3.9, wavelength < 5.0))
-		B4 = 107.57
-		B5 = 96.05
-		B_F322W2 = B4 + B5
-		B6 = 308.74
-		B_F444W = B6	
-		A_pix_NIRCam = 0.064*0.064
-		n_pix_NIRCam = 2*2
-		R_native_NIRCam = 1700
-		bkg[index_2] = self.bkg_flux_eqn(B_F322W2,A_pix_NIRCam,n_pix_NIRCam,R_native_NIRCam,R)
-		bkg[index_3] = self.bkg_flux_eqn(B_F444W,A_pix_NIRCam,n_pix_NIRCam,R_native_NIRCam,R)
-
-		# for MIRI, silitless mode, LRS prism optics
-		index_4 = np.nonzero(np.logical_and(wavelength>=5.0, wavelength < 11))
-		B7 = 213.69
-		B8 = 1970.02
-		B9 = 2972.29
-		B_LRS_prism = B7 + B8 + B9
-		A_pix_MIRI = 0.110*0.110
-		n_pix_MIRI = 2*2
-		R_native_MIRI = 100
-		bkg[index_4] = self.bkg_flux_eqn(B_LRS_prism,A_pix_MIRI,n_pix_MIRI,R_native_MIRI,R)
-
-		return bkg
-
-	def bkg_flux_eqn(self,B,A_pix,n_pix,R_native,R):
+		params = (instrument_table or instrument.JWST).resolve(wavelength)
+		return self.bkg_flux_eqn(params['B'],params['A_pix'],params['n_pix'],params['R_native'],R)
+
+	@staticmethod
+	def bkg_flux_eqn(B,A_pix,n_pix,R_native,R):
 		# Bkg returns the background signal in each spectra bin
 		# B: the backgroud of the intrument mode in electrons per arcsec^2 per second
 		# t: total exposure time
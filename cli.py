@@ -0,0 +1,226 @@
+"""
+command line batch runner for transit and secondary eclipse spectra
+
+the jobs are listed in a JSON, TOML or YAML manifest, see the template
+work_dir/manifest.template.json whose file paths must first point at local
+copies of the model spectra
+{
+	"output_dir": "results",
+	"seed": 0,
+	"defaults": {"d": 5, "A_tel": 25, "tau": 0.5, "R": 100, ...},
+	"jobs": [
+		{"name": "transit_PH3", "kind": "transit", "file_path": "spectra-CNOSP500.TRANSIT-IR-Res100"},
+		{"name": "secondary_PH3", "kind": "secondary", "file_path": "spectra-CNOSP500.IR.Res100.dat", "R_p": 7e7},
+		...
+	]
+}
+every job is the defaults updated by its own entry, the remaining keys are
+the keyword arguments of the Compute method. relative paths are taken from
+the directory of the manifest. jobs whose input file is missing are
+reported before anything runs
+
+every job draws its noise from its own child of the manifest seed. jobs
+given the same "seed_group" share one child instead, so models compared
+against each other see the same noise realizations (common random numbers)
+
+each job writes output_dir/<name>.npz holding binned_wavelength, mean, sigma
+and the content hash of its parameters, seed and input file. a job whose
+output already carries the current hash is skipped, so rerunning a manifest
+after a crash only computes the missing jobs. once all jobs are done their
+outputs are gathered in manifest order into the results_store.ResultsStore
+at output_dir/<store> ("store" key of the manifest, a directory of memmap-able
+columns by default, zlib compressed with "compression": "zlib", an HDF5 file
+when it ends with .h5)
+
+usage:
+python cli.py work_dir/manifest.json
+python cli.py work_dir/manifest.json --workers 8 --force
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+import batch
+import flux_cache
+from results_store import ResultsStore
+
+def load_manifest(file_path):
+	"""
+	read a .json, .toml or .yaml/.yml manifest
+	return the manifest dict
+	"""
+	extension = os.path.splitext(file_path)[1].lower()
+	if extension == '.json':
+		with open(file_path) as f:
+			return json.load(f)
+	if extension == '.toml':
+		try:
+			import tomllib
+		except ImportError:
+			import tomli as tomllib
+		with open(file_path,'rb') as f:
+			return tomllib.load(f)
+	if extension in ('.yaml','.yml'):
+		import yaml
+		with open(file_path) as f:
+			return yaml.safe_load(f)
+	raise ValueError("manifest must be .json, .toml, .yaml or .yml, got %r" % (file_path,))
+
+def expand_jobs(manifest,base_dir='.'):
+	"""
+	merge the defaults into every job, fill in missing names and make the
+	file paths absolute
+	return a list of (name, job) in manifest order
+	"""
+	defaults = manifest.get('defaults',{})
+	jobs = []
+	for i,entry in enumerate(manifest['jobs']):
+		job = dict(defaults)
+		job.update(entry)
+		name = str(job.pop('name','job%05d' % i))
+		job['file_path'] = os.path.join(base_dir,os.path.expanduser(job['file_path']))
+		jobs.append((name,job))
+	names = [name for name,job in jobs]
+	if len(set(names)) != len(names):
+		raise ValueError('job names in the manifest must be unique')
+	return jobs
+
+class MissingInputError(IOError):
+	pass
+
+def missing_inputs(jobs):
+	"""
+	return the indices of the jobs whose input file does not exist
+	"""
+	return [i for i,(name,job) in enumerate(jobs) if not os.path.isfile(job['file_path'])]
+
+def job_hash(job,seed,index):
+	"""
+	sha1 of the job parameters, the seed and index of its noise stream and
+	the content of its input file
+	"""
+	parameters = dict(job)
+	parameters['file_path'] = flux_cache.file_hash(job['file_path'])
+	text = json.dumps([parameters,seed,index],sort_keys=True)
+	return hashlib.sha1(text.encode()).hexdigest()
+
+def output_path(output_dir,name):
+	return os.path.join(output_dir,name + '.npz')
+
+def is_up_to_date(file_path,content_hash):
+	"""
+	whether file_path exists and was written for content_hash
+	"""
+	try:
+		with np.load(file_path) as data:
+			return str(data['hash']) == content_hash
+	except (IOError,OSError,KeyError,ValueError):
+		return False
+
+def write_result(file_path,content_hash,job,result):
+	"""
+	write the job output to a temporary file and move it in place, so an
+	interrupted run never leaves a truncated output behind
+	"""
+	binned_wavelength, mean, sigma = result
+	directory = os.path.dirname(file_path) or '.'
+	fd, tmp_path = tempfile.mkstemp(suffix='.npz',dir=directory)
+	try:
+		with os.fdopen(fd,'wb') as f:
+			np.savez(f,binned_wavelength=binned_wavelength,mean=mean,sigma=sigma,\
+				hash=np.array(content_hash),job=np.array(json.dumps(job,sort_keys=True)))
+		os.replace(tmp_path,file_path)
+	except BaseException:
+		os.remove(tmp_path)
+		raise
+
+def read_result(file_path):
+	"""
+	return binned_wavelength, mean, sigma of a job output
+	"""
+	with np.load(file_path) as data:
+		return data['binned_wavelength'], data['mean'], data['sigma']
+
+def run_manifest(manifest_path,n_workers=None,force=False,dry_run=False,log=sys.stdout):
+	"""
+	compute every job of the manifest whose output is missing or out of date
+	and gather all outputs into a freshly written ResultsStore
+	return the store, None for a dry run
+	"""
+	manifest = load_manifest(manifest_path)
+	base_dir = os.path.dirname(os.path.abspath(manifest_path))
+	output_dir = os.path.join(base_dir,manifest.get('output_dir','results'))
+	seed = manifest.get('seed',0)
+	if n_workers is None:
+		n_workers = manifest.get('n_workers')
+	jobs = expand_jobs(manifest,base_dir)
+	missing = missing_inputs(jobs)
+	for i in missing:
+		log.write('missing input of %s: %s\n' % (jobs[i][0],jobs[i][1]['file_path']))
+	if missing and not dry_run:
+		raise MissingInputError('%d of %d jobs have no input file' % (len(missing),len(jobs)))
+	if not dry_run and not os.path.isdir(output_dir):
+		os.makedirs(output_dir)
+
+	# a dry run lists the jobs whose input exists and that would run
+	indices = batch.seed_indices([job for name,job in jobs])
+	hashes = [None if i in missing else job_hash(job,seed,indices[i]) for i,(name,job) in enumerate(jobs)]
+	pending = [i for i,(name,job) in enumerate(jobs) if i not in missing \
+		and (force or not is_up_to_date(output_path(output_dir,name),hashes[i]))]
+	log.write('%d jobs, %d up to date, %d missing inputs, %d to run\n' % \
+		(len(jobs),len(jobs)-len(missing)-len(pending),len(missing),len(pending)))
+	if dry_run:
+		for i in pending:
+			log.write('  %s\n' % jobs[i][0])
+		return None
+
+	pending_jobs = [jobs[i][1] for i in pending]
+	seeds = [batch.job_seed(seed,indices[i]) for i in pending]
+	for n_done,(k,result) in enumerate(batch.iter_batch(pending_jobs,seeds,n_workers)):
+		name, job = jobs[pending[k]]
+		write_result(output_path(output_dir,name),hashes[pending[k]],job,result)
+		log.write('[%d/%d] %s\n' % (n_done+1,len(pending),name))
+		log.flush()
+
+	return write_store(os.path.join(output_dir,manifest.get('store','spectra')),jobs,output_dir,\
+		manifest.get('compression'))
+
+def write_store(store_path,jobs,output_dir,compression=None):
+	"""
+	append the outputs of all jobs to a new store next to store_path and
+	move it in place, compression: None or 'zlib' for directory stores
+	"""
+	root, extension = os.path.splitext(store_path)
+	tmp_path = root + '.tmp' + extension
+	remove_path(tmp_path)
+	store = ResultsStore(tmp_path,compression)
+	store.extend((job['kind'],job['file_path'],job) + read_result(output_path(output_dir,name)) + (None,) \
+		for name,job in jobs)
+	remove_path(store_path)
+	os.replace(tmp_path,store_path)
+	return ResultsStore(store_path)
+
+def remove_path(path):
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	elif os.path.exists(path):
+		os.remove(path)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='compute the transit and secondary eclipse spectra of a job manifest')
+	parser.add_argument('manifest',help='.json, .toml or .yaml job manifest')
+	parser.add_argument('-j','--workers',type=int,default=None,help='number of worker processes (default: all cores)')
+	parser.add_argument('--force',action='store_true',help='recompute jobs whose output is up to date')
+	parser.add_argument('--dry-run',action='store_true',help='only list the jobs that would run')
+	args = parser.parse_args(argv)
+	try:
+		run_manifest(args.manifest,args.workers,args.force,args.dry_run)
+	except MissingInputError as error:
+		parser.exit(1,'error: %s\n' % error)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,31 @@
+"""
+closed form (delta method) statistics of the transit depth and eclipse ratio
+for the gaussian noise model of NoiseEngine
+"""
+import numpy as np 
+
+def ratio_moments(star,planet,sigma_star,sigma_planet,transit,order=2):
+	"""
+	mean and sigma of (star - planet)/(star - bkg) for transits or
+	(planet - star)/(star - bkg) for secondary eclipses, where the noisy signals
+	are gaussian around star + bkg and planet + bkg
+
+	star, planet: binned source photon numbers without background
+	sigma_star, sigma_planet: total noise of the star and planet signals
+	order: 1 for the first order mean, 2 adds the second order bias of the ratio
+	return mean, sigma
+	"""
+	# X = planet - star, Y = star - bkg, cov(X,Y) = -sigma_star^2
+	mu_x = planet - star
+	mu_y = star
+	var_star = sigma_star*sigma_star
+	var_x = sigma_planet*sigma_planet + var_star
+	mean = mu_x/mu_y
+	if order == 2:
+		mean = mean + planet*var_star/mu_y**3
+	elif order != 1:
+		raise ValueError('order must be 1 or 2')
+	variance = var_x/mu_y**2 + 2*mu_x*var_star/mu_y**3 + mu_x*mu_x*var_star/mu_y**4
+	if transit:
+		mean = -mean
+	return mean, np.sqrt(variance)
@@ -0,0 +1,191 @@
+"""
+minimum exposure time reaching a target SNR per bin or a target detection
+significance of a model pair, for many targets at once
+
+every noise term of NoiseEngine has a closed form dependence on t and n_ints:
+the source and background photon numbers scale with t, the detector variance
+with n_ints and the systematic noise with t^2. with a = source photons, b =
+background photons and D^2 = detector variance at t = 1 s and n_ints = 1, the
+variance of the depth or ratio (error_propagation.ratio_moments) is
+
+	sigma^2(t) = A/t + B*n_ints/t^2 + C
+	A = (a_planet + b + q^2*(a_star + b))/a_star^2
+	B = D^2*(1 + q^2)/a_star^2
+	C = f^2*2*q^2
+
+with q = a_planet/a_star and f the systematic noise floor, so the time
+reaching a sigma is the root of a quadratic in 1/t. C does not average down
+with time, a sigma below sqrt(C) is never reached
+"""
+import numpy as np
+from star import Star
+from source_flux import flux_dilution
+from binned_photon_energy import Binning, BinnedTransitPhotonNumber, BinnedJWSTBackgroundPhotonEnergy
+from detector_noise import DetectorNoise
+from sys_noise import SysNoise
+from significance import delta_chi2, n_sigma
+
+def noise_coefficients(star,planet,background,detector_variance,sys_ratio):
+	"""
+	star, planet, background: photon numbers in 1 s
+	detector_variance: detector variance of a single integration
+	sys_ratio: systematic noise floor
+	return A, B, C of sigma^2(t) = A/t + B*n_ints/t^2 + C
+	"""
+	q = planet/star
+	A = (planet + background + q*q*(star + background))/(star*star)
+	B = detector_variance*(1 + q*q)/(star*star)
+	C = 2*(sys_ratio*q)**2
+	return A, B, C
+
+def variance(A,B,C,t,n_ints=None,t_int=None):
+	"""
+	sigma^2 of the depth or ratio after t seconds, with either n_ints
+	integrations in total or integrations of t_int seconds each
+	"""
+	if (n_ints is None) == (t_int is None):
+		raise ValueError('give exactly one of n_ints and t_int')
+	if t_int is not None:
+		return (A + B/t_int)/t + C
+	return A/t + B*n_ints/(t*t) + C
+
+def minimum_time(A,B,C,sigma,n_ints=None,t_int=None):
+	"""
+	smallest t with sigma^2(t) <= sigma^2, elementwise over the broadcast
+	arguments, inf where the systematic floor is above sigma
+	"""
+	if (n_ints is None) == (t_int is None):
+		raise ValueError('give exactly one of n_ints and t_int')
+	if t_int is not None:
+		A, B = A + B/t_int, 0.
+	else:
+		B = B*n_ints
+	margin = sigma*sigma - C
+	with np.errstate(divide='ignore',invalid='ignore'):
+		# root in 1/t of B/t^2 + A/t - margin, written to stay accurate when B is small
+		u = 2*margin/(A + np.sqrt(A*A + 4*B*margin))
+		return np.where(margin > 0,1/u,np.inf)
+
+class ExposureTime:
+	"""
+	noise coefficients of a library of spectra for many targets, from which
+	the minimum exposure time per bin (MinimumTime) or per model pair
+	(PairTime) is solved without resimulating
+	"""
+	def Compute(self,kind,wavelength,models,d,A_tel,tau,R,noise_floor,\
+		binned_wavelength_min,binned_wavelength_max,R_p=None,binning_mode='interpolate',star=None):
+		"""
+		kind: 'transit' (models are depths) or 'secondary' (models are planetary
+		      flux per wavelength in W/m^2/m, R_p is then required)
+		wavelength: wavelength grid in micron shared by the models
+		models: array of shape (n_models, n_wavelength) or (n_wavelength,)
+		d, A_tel, tau: scalars or arrays broadcast against each other, one
+		               element per target
+		R_p: planetary radius, scalar or one per model
+		star: Star of the hosts, T and R may be arrays broadcast against the
+		      targets, a solar blackbody by default
+
+		the results are stored in
+		binned_wavelength: (n_bins,)
+		mean: first order depth or ratio of shape (n_models, n_bins), or
+		      (target shape, n_models, n_bins) when the stars differ
+		A, B, C: noise coefficients of shape (target shape, n_models, n_bins)
+		"""
+		if kind not in ('transit','secondary'):
+			raise ValueError("kind must be 'transit' or 'secondary', got %r" % (kind,))
+		if kind == 'secondary' and R_p is None:
+			raise ValueError('R_p is required for secondary eclipses')
+		models = np.atleast_2d(np.asarray(models,dtype=float))
+		wavelength = np.asarray(wavelength,dtype=float)
+		d, A_tel, tau = np.broadcast_arrays(*[np.asarray(p,dtype=float) for p in (d,A_tel,tau)])
+		star = star or Star()
+		L_star = star.Spectra(wavelength)
+		self.shape = np.broadcast_shapes(d.shape,L_star.shape[:-1])
+
+		binning_obj = Binning(wavelength,binned_wavelength_min,binned_wavelength_max,R,binning_mode)
+		self.binned_wavelength = binned_wavelength = binning_obj.binned_wavelength
+		n_stars = L_star.shape[:-1]
+		L_star_bin = binning_obj.binning(L_star.reshape(-1,wavelength.size)).reshape(n_stars+(1,-1))
+		if kind == 'transit':
+			# binning is linear, bin L_star*depth without the (star, model) product on the wavelength grid
+			L_depth = (L_star.reshape(-1,1,wavelength.size)*models).reshape(-1,wavelength.size)
+			L_planet_bin = L_star_bin - binning_obj.binning(L_depth).reshape(n_stars+(len(models),-1))
+		else:
+			R_p_models = np.reshape(np.asarray(R_p,dtype=float),(-1,1))
+			L_planet_bin = binning_obj.binning(models)*(4*np.pi*R_p_models*R_p_models) + L_star_bin
+
+		d, A_tel, tau = [p[...,np.newaxis,np.newaxis] for p in (d,A_tel,tau)]
+		photon_eqn = BinnedTransitPhotonNumber.source_photon_number_eqn
+		star_photons = photon_eqn(binned_wavelength*1e-6,L_star_bin*flux_dilution(d),R,tau,A_tel)
+		planet_photons = photon_eqn(binned_wavelength*1e-6,L_planet_bin*flux_dilution(d),R,tau,A_tel)
+		background = BinnedJWSTBackgroundPhotonEnergy(binned_wavelength,R,1.).n_background
+		detector_variance = DetectorNoise(binned_wavelength,R,1.).sigma**2
+		sys_ratio = SysNoise(binned_wavelength,noise_floor).ratio
+		self.A, self.B, self.C = np.broadcast_arrays(*noise_coefficients(star_photons,planet_photons,\
+			background,detector_variance,sys_ratio))
+		q = L_planet_bin/L_star_bin
+		self.mean = 1 - q if kind == 'transit' else q - 1
+
+	def Sigma(self,t,n_ints=None,t_int=None):
+		"""
+		sigma of the depth or ratio after t seconds, see variance
+		"""
+		return np.sqrt(variance(self.A,self.B,self.C,t,n_ints,t_int))
+
+	def MinimumTime(self,snr=None,sigma=None,n_ints=None,t_int=None):
+		"""
+		smallest t reaching |mean|/sigma >= snr, or the given sigma, in every
+		bin, of shape (target shape, n_models, n_bins), inf where the noise
+		floor is never beaten
+		n_ints: total number of integrations, or
+		t_int: duration of one integration, n_ints is then t/t_int
+		"""
+		if (snr is None) == (sigma is None):
+			raise ValueError('give exactly one of snr and sigma')
+		if sigma is None:
+			sigma = np.abs(self.mean)/snr
+		return minimum_time(self.A,self.B,self.C,sigma,n_ints,t_int)
+
+	def PairTime(self,pairs,target_n_sigma,n_ints=None,t_int=None,dof=1,t_min=1e-3,t_max=1e9,rtol=1e-6):
+		"""
+		smallest t at which the data drawn around the true model of every pair
+		rejects the alternative at target_n_sigma (see significance), from a
+		bisection in log t which runs on all targets and pairs at once
+
+		pairs: (n_pairs, 2) model indices (true, alternative)
+		target_n_sigma: scalar or array broadcast against (target shape, n_pairs)
+		t_min, t_max: search interval, inf is returned above t_max
+		rtol: relative accuracy of the time
+		return array of shape (target shape, n_pairs)
+		"""
+		pairs = np.atleast_2d(np.asarray(pairs,dtype=int))
+		true, alternative = pairs[:,0], pairs[:,1]
+		mean = np.broadcast_to(self.mean,self.A.shape)
+		mean_true, mean_alternative = mean[...,true,:], mean[...,alternative,:]
+		A, B, C = self.A[...,true,:], self.B[...,true,:], self.C[...,true,:]
+
+		def significance(t):
+			sigma = np.sqrt(variance(A,B,C,t[...,np.newaxis],n_ints,t_int))
+			return n_sigma(delta_chi2(mean_true,mean_alternative,sigma),dof)
+
+		shape = mean_true.shape[:-1]
+		target_n_sigma = np.broadcast_to(target_n_sigma,shape)
+		log_lo = np.full(shape,np.log(t_min))
+		log_hi = np.full(shape,np.log(t_max))
+		reached = significance(np.exp(log_hi)) >= target_n_sigma
+		n_iter = int(np.ceil(np.log2(np.log(t_max/t_min)/np.log1p(rtol))))
+		for i in range(n_iter):
+			log_mid = (log_lo + log_hi)/2
+			above = significance(np.exp(log_mid)) >= target_n_sigma
+			log_hi = np.where(above,log_mid,log_hi)
+			log_lo = np.where(above,log_lo,log_mid)
+		return np.where(reached,np.exp(log_hi),np.inf)
+
+	@staticmethod
+	def Transits(t,t_transit):
+		"""
+		number of transits or eclipses of t_transit seconds in transit
+		(or in eclipse) needed to collect t seconds
+		"""
+		with np.errstate(invalid='ignore'):
+			return np.where(np.isfinite(t),np.ceil(np.asarray(t)/t_transit),np.inf)
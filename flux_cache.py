@@ -0,0 +1,141 @@
+"""
+memoize the binned stellar and planetary luminosity of input spectra files,
+keyed on the file content, the binning parameters and the star
+"""
+import collections
+import hashlib
+import os
+import numpy as np 
+from read_data import SpectraData, TransitData, EmergentData
+from binned_photon_energy import Binning
+from profiling import NULL_PROFILER
+
+class LRUCache:
+	"""
+	least recently used cache of tuples of arrays, bounded to maxsize entries
+	in memory and optionally persisted as npz files in cache_dir
+	"""
+	def __init__(self,maxsize=64,cache_dir=None):
+		self.maxsize = maxsize
+		self.cache_dir = cache_dir
+		self.entries = collections.OrderedDict()
+
+	def get(self,key,compute):
+		"""
+		return the arrays stored under key, calling compute() on a miss
+		"""
+		if key in self.entries:
+			self.entries.move_to_end(key)
+			return self.entries[key]
+		value = self._load(key)
+		if value is None:
+			value = tuple(compute())
+			self._save(key,value)
+		for array in value:
+			array.flags.writeable = False
+		self.entries[key] = value
+		while len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+		return value
+
+	def clear(self):
+		self.entries.clear()
+
+	def _path(self,key):
+		return os.path.join(self.cache_dir,key+'.npz')
+
+	def _load(self,key):
+		if self.cache_dir is None or not os.path.exists(self._path(key)):
+			return None
+		with np.load(self._path(key)) as data:
+			return tuple(data['arr_%d' % i] for i in range(len(data.files)))
+
+	def _save(self,key,value):
+		if self.cache_dir is None:
+			return
+		if not os.path.isdir(self.cache_dir):
+			os.makedirs(self.cache_dir)
+		# write to a temporary file first so a crash never leaves a partial entry
+		tmp_path = self._path(key)+'.%d.tmp' % os.getpid()
+		with open(tmp_path,'wb') as f:
+			np.savez(f,*value)
+		os.replace(tmp_path,self._path(key))
+
+# content hashes of recently hashed files with the size and modification
+# time they were computed for, one entry per path
+_file_hashes = collections.OrderedDict()
+_file_hashes_size = 4096
+
+def file_hash(file_path):
+	"""
+	sha1 of the file content, recomputed when the size or modification time
+	of the file changes
+	"""
+	path = os.path.abspath(file_path)
+	stat = os.stat(path)
+	stamp = (stat.st_size,stat.st_mtime_ns)
+	entry = _file_hashes.get(path)
+	if entry is not None and entry[0] == stamp:
+		_file_hashes.move_to_end(path)
+		return entry[1]
+	sha1 = hashlib.sha1()
+	with open(path,'rb') as f:
+		for block in iter(lambda: f.read(1 << 20),b''):
+			sha1.update(block)
+	_file_hashes[path] = (stamp,sha1.hexdigest())
+	_file_hashes.move_to_end(path)
+	while len(_file_hashes) > _file_hashes_size:
+		_file_hashes.popitem(last=False)
+	return sha1.hexdigest()
+
+default_cache = LRUCache()
+
+def binned_luminosity(kind,file_path,star,binned_wavelength_min,binned_wavelength_max,R,cache=default_cache,\
+	binning_mode='interpolate',profiler=NULL_PROFILER):
+	"""
+	kind: 'transit' or 'secondary'
+	file_path: spectra file, or an already read TransitData/EmergentData
+	star: Star object providing the stellar luminosity, blackbody or from its grid
+	cache: LRUCache to use, None to always recompute
+	binning_mode: 'interpolate' or 'average', see Binning
+	profiler: StageProfiler timing the read_data, star and binning stages of a miss
+
+	return binned_wavelength, binned L_star (W/m) and
+	for transits the binned in transit luminosity L_star*(1-depth) (W/m),
+	for secondary eclipses the binned planetary flux per wavelength (W/m^2/m)
+	"""
+	def compute():
+		with profiler.stage('read_data') as stage:
+			if isinstance(file_path,SpectraData):
+				data = file_path
+			elif kind == 'transit':
+				data = TransitData()
+				data.Read(file_path)
+			elif kind == 'secondary':
+				data = EmergentData()
+				data.Read(file_path)
+			else:
+				raise ValueError("kind must be 'transit' or 'secondary', got %r" % (kind,))
+			stage.output(data.wavelength)
+		with profiler.stage('star') as stage:
+			L_star = star.Spectra(data.wavelength)
+			stage.output(L_star)
+		with profiler.stage('binning') as stage:
+			binning_obj = Binning(data.wavelength,binned_wavelength_min,binned_wavelength_max,R,binning_mode)
+			if kind == 'transit':
+				planet = L_star*(1-data.depth)
+			else:
+				planet = data.flux_per_wavelength
+			binned = binning_obj.binned_wavelength, binning_obj.binning(L_star), binning_obj.binning(planet)
+			stage.output(*binned)
+		return binned
+
+	if cache is None:
+		return compute()
+	if isinstance(file_path,SpectraData):
+		source_hash = file_path.content_hash()
+	else:
+		source_hash = file_hash(file_path)
+	key = repr((kind,source_hash,float(binned_wavelength_min),float(binned_wavelength_max),\
+		float(R),binning_mode) + star.key())
+	return cache.get(hashlib.sha1(key.encode()).hexdigest(),compute)
@@ -0,0 +1,83 @@
+"""
+data driven table of the JWST instrument modes used by the background,
+detector and systematic noise
+"""
+import collections
+import hashlib
+import json
+import numpy as np 
+
+# one mode per wavelength band [wavelength_min, wavelength_max) in micron
+# B: background of the mode in electrons per arcsec^2 per second
+# A_pix: area subtended by each pixel in arcsec^2
+# n_pix: number of spatial x 2 spectral pixels summed in each native resolution element
+# R_native: native resolution of the mode
+# N_d: detector noise of a single integration
+# floor_index: entry of the noise_floor list applied to the mode
+# noise_floor: default systematic noise floor
+JWST_MODES = [
+	# NIRISS, bright SOSS mode, GR700XD optics, sum of F115W, F150W and F200W background
+	dict(name='NIRISS GR700XD',wavelength_min=1.0,wavelength_max=2.5,B=197.30+237.24+193.07,\
+		A_pix=0.065*0.065,n_pix=25*2,R_native=700,N_d=18,floor_index=0,noise_floor=20e-6),
+	# NIRCam, LW grism mode, F322W2 optics, sum of F277W and F356W background
+	dict(name='NIRCam F322W2',wavelength_min=2.5,wavelength_max=3.9,B=107.57+96.05,\
+		A_pix=0.064*0.064,n_pix=2*2,R_native=1700,N_d=18,floor_index=1,noise_floor=30e-6),
+	# NIRCam, LW grism mode, F444W
+	dict(name='NIRCam F444W',wavelength_min=3.9,wavelength_max=5.0,B=308.74,\
+		A_pix=0.064*0.064,n_pix=2*2,R_native=1700,N_d=18,floor_index=1,noise_floor=30e-6),
+	# MIRI, slitless mode, LRS prism optics, sum of F560W, F770W and F1000W background
+	dict(name='MIRI LRS prism',wavelength_min=5.0,wavelength_max=11.0,B=213.69+1970.02+2972.29,\
+		A_pix=0.110*0.110,n_pix=2*2,R_native=100,N_d=28,floor_index=2,noise_floor=50e-6),
+]
+
+# per bin parameters, wavelengths outside every mode get zeros
+COLUMNS = ('B','A_pix','n_pix','R_native','N_d','floor_index','noise_floor')
+
+class InstrumentTable:
+	"""
+	instrument modes sorted by wavelength, resolved per wavelength bin with
+	a single searchsorted and cached per wavelength grid
+	"""
+	def __init__(self,modes=JWST_MODES,cache_size=32):
+		modes = sorted(modes,key=lambda mode: mode['wavelength_min'])
+		self.names = [mode['name'] for mode in modes]
+		self.wavelength_min = np.array([mode['wavelength_min'] for mode in modes],dtype=float)
+		self.wavelength_max = np.array([mode['wavelength_max'] for mode in modes],dtype=float)
+		if np.any(self.wavelength_min[1:] < self.wavelength_max[:-1]):
+			raise ValueError('instrument modes overlap in wavelength')
+		self.columns = dict((name,np.array([mode[name] for mode in modes])) for name in COLUMNS)
+		self.cache_size = cache_size
+		self._cache = collections.OrderedDict()
+
+	@classmethod
+	def from_json(cls,file_path):
+		"""
+		read a list of modes, each with the keys of JWST_MODES
+		"""
+		with open(file_path) as f:
+			return cls(json.load(f))
+
+	def resolve(self,wavelength):
+		"""
+		wavelength: wavelength grid in micron
+		return a dict of per bin arrays of the COLUMNS and 'mode', the index of
+		the mode of each bin (-1 outside every mode)
+		"""
+		wavelength = np.ascontiguousarray(wavelength,dtype=float)
+		key = (wavelength.shape,hashlib.sha1(wavelength).hexdigest())
+		if key in self._cache:
+			self._cache.move_to_end(key)
+			return self._cache[key]
+		index = np.searchsorted(self.wavelength_min,wavelength,side='right') - 1
+		clipped = np.clip(index,0,None)
+		valid = (index >= 0) & (wavelength < self.wavelength_max[clipped])
+		params = dict((name,np.where(valid,column[clipped],0)) for name,column in self.columns.items())
+		params['mode'] = np.where(valid,index,-1)
+		for array in params.values():
+			array.flags.writeable = False
+		self._cache[key] = params
+		while len(self._cache) > self.cache_size:
+			self._cache.popitem(last=False)
+		return params
+
+JWST = InstrumentTable()
@@ -0,0 +1,170 @@
+"""
+simulate the per integration light curve of a transit observation
+"""
+import numpy as np 
+from star import Star
+from source_flux import flux_dilution
+from binned_photon_energy import BinnedTransitPhotonNumber, BinnedJWSTBackgroundPhotonEnergy
+from detector_noise import DetectorNoise
+from sys_noise import SysNoise
+from noise_engine import NoiseEngine, CovarianceNoise
+from running_stats import RunningStatistics
+from spectra import _resolve_cache
+import flux_cache
+
+class CommonMode:
+	"""
+	systematic noise shared by every bin of a frame, given the values of a chunk of frames
+	"""
+	def __init__(self,series):
+		self.series = series
+
+	def sample(self,rng,shape):
+		# shape is (1, n_chunk, n_bins)
+		return np.broadcast_to(self.series[np.newaxis,:,np.newaxis],shape)
+
+class SeparableModes:
+	"""
+	systematic noise with covariance C_time x C_bins over a chunk of frames,
+	each kept eigen mode of the CovarianceNoise across bins follows its own
+	time series, the variance left out of the modes is white in time
+	"""
+	def __init__(self,series,spectral):
+		# series is (n_chunk, rank)
+		self.series = series
+		self.spectral = spectral
+
+	def sample(self,rng,shape):
+		# shape is (1, n_chunk, n_bins)
+		x = self.series.dot(self.spectral.factor.T)
+		if np.any(self.spectral.residual > 0):
+			x += rng.standard_normal(x.shape)*self.spectral.residual
+		return x[np.newaxis]
+
+class TransitLightCurve:
+	"""
+	generate the n_ints x n_bins frames of a visit chunk by chunk and compute
+	the binned transit depth from them on the fly
+	"""
+	def __init__(self,binned_wavelength = None, depth = None):
+		self.binned_wavelength=binned_wavelength
+		self.mean_depth = depth
+
+	def Compute(self,transit_file_path,d,\
+		A_tel,tau,R,noise_floor,binned_wavelength_min,binned_wavelength_max,\
+		n_ints,t,transit_duration,ingress_duration,transit_center=None,rng=None,\
+		cache=True,binning_mode='interpolate',correlated=None,time_correlated=None):
+		"""
+		set up the frames, the parameters are the same as TransitSpectra.Compute
+		t: total duration of the visit, split into n_ints integrations
+		transit_duration: time between first and fourth contact
+		ingress_duration: duration of ingress and of egress
+		transit_center: mid transit time from the start of the visit, t/2 by default
+
+		correlated: optional CovarianceNoise or PowerSpectrumNoise across bins
+		            for the systematic noise of each frame
+		time_correlated: optional PowerSpectrumNoise of length n_ints, the systematic
+		                 noise is then a common mode across bins following this
+		                 power spectrum in time; together with a CovarianceNoise
+		                 as correlated the covariance over integrations and bins
+		                 is the product of the two (see SeparableModes)
+
+		the systematic noise floor is drawn per frame and scaled by sqrt(n_ints),
+		so the sum of all frames carries the same floor as in TransitSpectra
+		"""
+		star = Star()
+		binned_wavelength, L_star_bin, L_in_transit_bin = flux_cache.binned_luminosity('transit',transit_file_path,star,\
+			binned_wavelength_min,binned_wavelength_max,R,_resolve_cache(cache),binning_mode)
+		dilution = flux_dilution(d)
+		t_int = t/float(n_ints)
+		# photons of a single integration
+		source_obj = BinnedTransitPhotonNumber(binned_wavelength_min,binned_wavelength_max,None,R,tau,A_tel,t_int,\
+			binned_flux=(binned_wavelength,L_star_bin*dilution,L_in_transit_bin*dilution))
+		self.n_star_frame = source_obj.n_star_bin
+		self.n_in_transit_frame = source_obj.n_in_transit_bin
+		self.n_background_frame = BinnedJWSTBackgroundPhotonEnergy(binned_wavelength,R,t_int).n_background
+		self.detector_noise = DetectorNoise(binned_wavelength,R,1)
+		self.sys_noise = SysNoise(binned_wavelength,noise_floor)
+		self.sys_noise.ratio = self.sys_noise.ratio*np.sqrt(n_ints)
+
+		if transit_center is None:
+			transit_center = 0.5*t
+		self.time = (np.arange(n_ints) + 0.5)*t_int
+		self.profile = self.transit_profile(self.time,transit_center,transit_duration,ingress_duration)
+		self.rng = np.random.default_rng(rng)
+		if time_correlated is not None and correlated is not None and not isinstance(correlated,CovarianceNoise):
+			raise ValueError('time_correlated systematic noise needs a CovarianceNoise across bins')
+		self.correlated = correlated
+		# unit variance common mode of every integration, or time series of every
+		# spectral mode, drawn once for the visit
+		self.common_mode = None
+		self.mode_series = None
+		if time_correlated is not None:
+			if correlated is None:
+				self.common_mode = time_correlated.sample(self.rng,(n_ints,))
+			else:
+				self.mode_series = time_correlated.sample(self.rng,(correlated.rank,n_ints)).T
+		self.binned_wavelength = binned_wavelength
+		self.n_ints = n_ints
+
+	@staticmethod
+	def transit_profile(time,transit_center,transit_duration,ingress_duration):
+		"""
+		trapezoid, 0 out of transit, 1 between second and third contact,
+		linear during ingress and egress
+		"""
+		distance = np.abs(time - transit_center)
+		half_duration = 0.5*transit_duration
+		return np.clip((half_duration - distance)/ingress_duration,0.,1.)
+
+	def frames(self,chunk_size=1000):
+		"""
+		generator yielding (time, frames) for chunks of up to chunk_size integrations,
+		frames has shape (n_chunk, n_bins) and contains source plus background counts
+
+		the out of transit frames and the frames between second and third contact
+		are accumulated while iterating, once the generator is exhausted mean_depth
+		and sigma hold the binned transit depth and its uncertainty
+		"""
+		out_of_transit = RunningStatistics()
+		in_transit = RunningStatistics()
+		for start in range(0,self.n_ints,chunk_size):
+			stop = min(start+chunk_size,self.n_ints)
+			profile = self.profile[start:stop,np.newaxis]
+			source = self.n_star_frame - profile*(self.n_star_frame - self.n_in_transit_frame)
+			correlated = self.correlated
+			if self.common_mode is not None:
+				correlated = CommonMode(self.common_mode[start:stop])
+			elif self.mode_series is not None:
+				correlated = SeparableModes(self.mode_series[start:stop],self.correlated)
+			noise_engine = NoiseEngine(source,self.n_background_frame,self.detector_noise,self.sys_noise,\
+				self.rng,correlated)
+			frames = noise_engine.generate(1)[0]
+			signal = frames - self.n_background_frame
+			out_of_transit.update(signal[profile[:,0] == 0])
+			in_transit.update(signal[profile[:,0] == 1])
+			yield self.time[start:stop], frames
+		self._depth(out_of_transit,in_transit)
+
+	def Write(self,file_path,chunk_size=1000,dtype=np.float64):
+		"""
+		stream all frames into a memory-mapped .npy file of shape (n_ints, n_bins)
+		return the memory-mapped array
+		"""
+		out = np.lib.format.open_memmap(file_path,mode='w+',dtype=dtype,shape=(self.n_ints,self.binned_wavelength.size))
+		row = 0
+		for time, frames in self.frames(chunk_size):
+			out[row:row+len(frames)] = frames
+			row += len(frames)
+		out.flush()
+		return out
+
+	def _depth(self,out_of_transit,in_transit):
+		if out_of_transit.n < 2 or in_transit.n < 2:
+			raise ValueError('the visit needs at least two frames out of transit and two in full transit')
+		# depth = 1 - in/out with the standard errors of the two mean signals
+		mean_out, mean_in = out_of_transit.mean, in_transit.mean
+		var_out = out_of_transit.variance/(out_of_transit.n - 1)
+		var_in = in_transit.variance/(in_transit.n - 1)
+		self.mean_depth = 1 - mean_in/mean_out
+		self.sigma = np.sqrt(var_in/mean_out**2 + var_out*mean_in**2/mean_out**4)
@@ -1,30 +1,259 @@
 """
 for a given source signal, generate n_instance noisy signals
 """
+import warnings
 import numpy as np 
+from scipy.special import ndtri
+
+# ways of drawing the standard normal deviates of NoiseEngine
+SAMPLING = ('random','antithetic','sobol','halton')
+# largest number of quasi random dimensions, scipy's limit for sobol, halton
+# scrambling needs gigabytes beyond a few thousand
+QMC_MAX_DIMENSION = dict(sobol=21201,halton=2000)
+
+class QuasiRandomStream:
+	"""
+	one scrambled sobol or halton sequence shared by the engines whose draws
+	are combined, each engine reads its own block of columns of the same
+	points, so their deviates stay independent and every point is drawn once
+	"""
+	def __init__(self,sampling,rng):
+		self.sampling = sampling
+		self.rng = rng
+		self.dimension = 0
+		self._engine = None
+		self._points = None
+		self._used = set()
+
+	def add(self,length):
+		"""
+		reserve length more dimensions, return the first one
+		"""
+		if self._engine is not None:
+			raise ValueError('dimensions must be reserved before the first draw')
+		offset = self.dimension
+		if offset + length > QMC_MAX_DIMENSION[self.sampling]:
+			raise ValueError('%s sampling supports at most %d dimensions (bins of the star and planet '\
+				'signals together), %d are needed, use fewer bins or models per call or random sampling' % \
+				(self.sampling,QMC_MAX_DIMENSION[self.sampling],offset + length))
+		self.dimension += length
+		return offset
+
+	def engine(self):
+		if self._engine is None:
+			from scipy.stats import qmc
+			engine = qmc.Sobol if self.sampling == 'sobol' else qmc.Halton
+			try:
+				self._engine = engine(self.dimension,scramble=True,rng=self.rng)
+			except TypeError:
+				self._engine = engine(self.dimension,scramble=True,seed=self.rng)
+		return self._engine
+
+	def random(self,n,offset,length):
+		"""
+		columns offset to offset + length of n points, a new block of points is
+		drawn once the engine at offset has read the current one
+		"""
+		if self._points is None or len(self._points) != n or offset in self._used:
+			with warnings.catch_warnings():
+				# sobol points are best balanced for powers of 2 but valid for any n
+				warnings.simplefilter('ignore',UserWarning)
+				self._points = self.engine().random(n)
+			self._used = set()
+		self._used.add(offset)
+		return self._points[:,offset:offset+length]
 
 class NoiseEngine:
-	def __init__(self,source,bkg,detector_noise,sys_noise):
+	def __init__(self,source,bkg,detector_noise,sys_noise,rng=None,correlated=None,sampling='random',\
+		qmc_shared=None):
 		"""
 		source: a numpy array containing binned number of photons
 		bkg: a numpy array containing binned number of photons
+		rng: seed, SeedSequence, BitGenerator or Generator used to draw the noise,
+		     pass the same value to reproduce the same realizations
+		correlated: optional CovarianceNoise or PowerSpectrumNoise, the systematic
+		            noise is then correlated across bins instead of independent,
+		            its variance in each bin is unchanged
+		sampling: 'random' independent deviates,
+		          'antithetic' the second half of every draw mirrors the first half,
+		          which reduces the variance of the mean but not of sigma,
+		          'sobol' or 'halton' scrambled quasi random sequences over the bins
+		          (scipy.stats.qmc), which continue from one generate call to the next
+		          and reduce the variance of the mean; the correlated noise is
+		          always random
+		qmc_shared: engine whose draws are combined with this one (the star
+		            engine for the planet), both then read disjoint columns of
+		            one quasi random sequence so their deviates stay independent
+		compared models simulated with the same rng seed share their random
+		numbers (common random numbers), so their difference is less noisy
 		"""
+		if sampling not in SAMPLING:
+			raise ValueError('sampling must be one of %s, got %r' % (', '.join(SAMPLING),sampling))
 		self.length = source.size
+		self.shape = source.shape
 		self.source = source
 		self.bkg = bkg
 		# total detector noise
 		sigma_detector = detector_noise.sigma
-		sigma_sys = sys_noise.ratio*source
-		self.sigma_total = np.sqrt(source + bkg + sigma_detector**2 + sigma_sys**2)
+		self.sigma_sys = sys_noise.ratio*source
+		self.sigma_white = np.sqrt(source + bkg + sigma_detector**2)
+		self.sigma_total = np.sqrt(self.sigma_white**2 + self.sigma_sys**2)
+		self.rng = np.random.default_rng(rng)
+		self.correlated = correlated
+		self.sampling = sampling
+		self.qmc_stream = None
+		if sampling in QMC_MAX_DIMENSION:
+			if qmc_shared is not None:
+				if qmc_shared.sampling != sampling:
+					raise ValueError('engines sharing a quasi random sequence need the same sampling')
+				self.qmc_stream = qmc_shared.qmc_stream
+			else:
+				self.qmc_stream = QuasiRandomStream(sampling,self.rng)
+			self.qmc_offset = self.qmc_stream.add(self.length)
+
+	def generate(self,n_instance,out=None,dtype=np.float64,index=None,centered=False):
+		"""
+		draw all n_instance noisy signals in a single call
+		out: optional preallocated array of shape (n_instance,) + source.shape,
+		     its dtype (float32 or float64) overrides dtype
+		dtype: float32 or float64
+		index: optional indices along the last axis of the source, only these
+		       bins are drawn and the last axis of the result has len(index)
+		       elements; correlated noise is still drawn over all bins so the
+		       selected bins keep their correlation
+		centered: only return the noise, without source + bkg, so that a
+		          float32 result keeps the digits of the noise
+		return an array of shape (n_instance,) + source.shape
+		"""
+		if index is None:
+			shape = (n_instance,) + self.shape
+		else:
+			shape = (n_instance,) + self.shape[:-1] + (len(index),)
+		if out is None:
+			out = np.empty(shape,dtype=dtype)
+		elif out.shape != shape:
+			raise ValueError('out has shape %s, expected %s' % (out.shape,shape))
+		if index is None:
+			source, bkg, sigma_total, sigma_white, sigma_sys = \
+				self.source, self.bkg, self.sigma_total, self.sigma_white, self.sigma_sys
+		else:
+			source, bkg, sigma_total, sigma_white, sigma_sys = [np.broadcast_to(value,self.shape)[...,index] \
+				for value in (self.source,self.bkg,self.sigma_total,self.sigma_white,self.sigma_sys)]
+		self.standard_normal(out,index)
+		if self.correlated is None:
+			out *= sigma_total
+		else:
+			out *= sigma_white
+			correlated = self.correlated.sample(self.rng,(n_instance,)+self.shape)
+			if index is not None:
+				correlated = correlated[...,index]
+			out += correlated*sigma_sys
+		if not centered:
+			out += source + bkg
+		return out
 
-	def generate(self,n_instance):
-		noisy_signal_ensemble = []
-		for i in range(n_instance):
-			noise_instance = self.sigma_total*np.random.randn(self.length)
-			noisy_signal_instance = self.source + self.bkg + noise_instance
-			noisy_signal_ensemble.append(noisy_signal_instance)
+	def standard_normal(self,out,index=None):
+		"""
+		fill out with standard normal deviates drawn with self.sampling
+		"""
+		n = len(out)
+		if self.sampling == 'random':
+			self.rng.standard_normal(out=out,dtype=out.dtype)
+		elif self.sampling == 'antithetic':
+			half = (n+1)//2
+			self.rng.standard_normal(out=out[:half],dtype=out.dtype)
+			np.negative(out[:n-half],out=out[half:])
+		else:
+			u = self.qmc_stream.random(n,self.qmc_offset,self.length)
+			tiny = np.finfo(np.float64).tiny
+			z = ndtri(np.clip(u,tiny,1-np.finfo(np.float64).eps)).reshape((n,)+self.shape)
+			out[...] = z if index is None else z[...,index]
+		return out
+
+class CovarianceNoise:
+	"""
+	unit variance noise correlated across the last axis, sampled through the
+	eigen decomposition of the correlation matrix truncated to its leading modes,
+	a draw costs O(n*rank) instead of O(n^2)
+	"""
+	def __init__(self,covariance,rank=None,tol=1e-3):
+		"""
+		covariance: (n, n) covariance or correlation matrix across bins, only the
+		            correlation is used, the amplitude comes from the noise floor
+		rank: number of eigen modes kept, by default the fewest modes holding
+		      1 - tol of the total variance
+		the variance left out of the kept modes is added back as independent
+		noise so every bin keeps unit variance
+		"""
+		covariance = np.asarray(covariance,dtype=float)
+		std = np.sqrt(np.diag(covariance))
+		correlation = covariance/np.outer(std,std)
+		eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+		order = np.argsort(eigenvalues)[::-1]
+		eigenvalues = np.clip(eigenvalues[order],0.,None)
+		if rank is None:
+			explained = np.cumsum(eigenvalues)/eigenvalues.sum()
+			rank = int(np.searchsorted(explained,1-tol)) + 1
+		self.rank = min(rank,eigenvalues.size)
+		self.factor = eigenvectors[:,order[:self.rank]]*np.sqrt(eigenvalues[:self.rank])
+		self.residual = np.sqrt(np.clip(1. - (self.factor**2).sum(axis=1),0.,None))
+		self.n = correlation.shape[0]
+
+	def sample(self,rng,shape):
+		"""
+		return a float64 array of shape shape, the last axis must have n elements
+		"""
+		z = rng.standard_normal(shape[:-1]+(self.rank,))
+		x = z.dot(self.factor.T)
+		if np.any(self.residual > 0):
+			x += rng.standard_normal(shape)*self.residual
+		return x
 
-		return noisy_signal_ensemble
+class PowerSpectrumNoise:
+	"""
+	stationary unit variance noise along the last axis synthesized by FFT from
+	a power spectrum, a draw costs O(n log n)
+	"""
+	def __init__(self,n,power,pad=True):
+		"""
+		n: number of samples, bins or integrations
+		power: function of the frequency in cycles per sample (0 to 0.5), or an
+		       array of its values on np.fft.rfftfreq(n_fft)
+		pad: synthesize on n_fft = 2n samples and keep the first n, which removes
+		     the periodic wrap around of the FFT, otherwise n_fft = n
+		"""
+		self.n = n
+		self.n_fft = 2*n if pad else n
+		frequency = np.fft.rfftfreq(self.n_fft)
+		power = power(frequency) if callable(power) else np.asarray(power,dtype=float)
+		if power.shape != frequency.shape:
+			raise ValueError('power needs %d values, got %d' % (frequency.size,power.size))
+		# irfft keeps only the real part of the zero and nyquist coefficients,
+		# which need twice the amplitude^2 to carry the power of the others
+		weight = np.full(frequency.size,2.)
+		weight[0] = 1.
+		if self.n_fft % 2 == 0:
+			weight[-1] = 1.
+		amplitude = np.sqrt(power*2/weight)
+		# variance of irfft output for unit complex gaussian coefficients
+		variance = (2*weight*power).sum()/self.n_fft**2
+		self.amplitude = amplitude/np.sqrt(variance)
 
+	def sample(self,rng,shape):
+		"""
+		return a float64 array of shape shape, the last axis must have n elements
+		"""
+		spectrum_shape = shape[:-1]+(self.amplitude.size,)
+		spectrum = rng.standard_normal(spectrum_shape) + 1j*rng.standard_normal(spectrum_shape)
+		spectrum *= self.amplitude
+		return np.fft.irfft(spectrum,self.n_fft,axis=-1)[...,:self.n]
 
-		
\ No newline at end of file
+def power_law(alpha,f_min=None):
+	"""
+	power spectrum proportional to f^-alpha, flat below f_min
+	(the lowest non zero frequency by default)
+	"""
+	def power(frequency):
+		floor = f_min if f_min is not None else frequency[1]
+		return np.maximum(frequency,floor)**(-alpha)
+	return power
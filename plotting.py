@@ -0,0 +1,29 @@
+"""
+plotting helpers of the data and spectra classes, matplotlib is only
+imported on the first plot so the compute modules stay free of it
+"""
+
+def pyplot():
+	"""
+	return matplotlib.pyplot, imported on first use
+	"""
+	import matplotlib.pyplot as plt
+	return plt
+
+def plot_data(wavelength,y,**kwargs):
+	"""
+	plot y against wavelength on a new figure
+	return the axes
+	"""
+	fig = pyplot().figure()
+	ax = fig.add_subplot(111)
+	ax.plot(wavelength,y,**kwargs)
+	return ax
+
+def plot_spectra(ax,binned_wavelength,mean,sigma,**kwargs):
+	"""
+	plot the binned spectra with its 1 sigma error bars on ax
+	return the axes
+	"""
+	ax.errorbar(binned_wavelength,mean,sigma,**kwargs)
+	return ax
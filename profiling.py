@@ -0,0 +1,182 @@
+"""
+optional per stage instrumentation of the spectra pipeline
+"""
+import collections
+import time
+import tracemalloc
+
+class StageRecord:
+	"""
+	measurements of one stage, accumulated over its calls
+	wall_time, cpu_time: seconds
+	allocated_bytes, peak_bytes: net and peak traced memory above the start of the
+	                             stage, None unless trace_memory, the peak includes
+	                             the peaks of the nested stages
+	array_bytes, array_shape: size of the arrays reported with Stage.output
+	"""
+	def __init__(self,name,parent=None):
+		self.name = name
+		self.parent = parent
+		self.calls = 0
+		self.wall_time = 0.
+		self.cpu_time = 0.
+		self.allocated_bytes = None
+		self.peak_bytes = None
+		self.array_bytes = 0
+		self.array_shape = None
+
+	def merge(self,other):
+		self.calls += other.calls
+		self.wall_time += other.wall_time
+		self.cpu_time += other.cpu_time
+		if other.allocated_bytes is not None:
+			self.allocated_bytes = (self.allocated_bytes or 0) + other.allocated_bytes
+			self.peak_bytes = max(self.peak_bytes or 0,other.peak_bytes)
+		self.array_bytes = max(self.array_bytes,other.array_bytes)
+		self.array_shape = other.array_shape or self.array_shape
+
+	def as_dict(self):
+		return dict(self.__dict__)
+
+class ProfileReport:
+	"""
+	stage records in the order the stages first ran, nested stages name their parent
+	"""
+	def __init__(self):
+		self.stages = collections.OrderedDict()
+
+	def add(self,record):
+		key = (record.parent,record.name)
+		if key not in self.stages:
+			self.stages[key] = StageRecord(record.name,record.parent)
+		self.stages[key].merge(record)
+
+	def __getitem__(self,name):
+		for record in self.stages.values():
+			if record.name == name:
+				return record
+		raise KeyError(name)
+
+	@property
+	def records(self):
+		return list(self.stages.values())
+
+	@property
+	def wall_time(self):
+		# nested stages are already included in their parent
+		return sum(record.wall_time for record in self.records if record.parent is None)
+
+	def check(self):
+		"""
+		raise ValueError if the peak memory of a stage is below the peak of one
+		of its nested stages
+		"""
+		for (parent,name),record in self.stages.items():
+			if parent is None or record.peak_bytes is None:
+				continue
+			for outer in self.stages.values():
+				if outer.name == parent and outer.peak_bytes is not None and outer.peak_bytes < record.peak_bytes:
+					raise ValueError('stage %s peaks at %d bytes, below its nested stage %s at %d bytes' % \
+						(parent,outer.peak_bytes,name,record.peak_bytes))
+
+	def as_dict(self):
+		return dict(wall_time=self.wall_time,stages=[record.as_dict() for record in self.records])
+
+	def __str__(self):
+		lines = ['%-24s %6s %12s %12s %14s' % ('stage','calls','wall (s)','cpu (s)','array bytes')]
+		for record in self.records:
+			name = record.name if record.parent is None else '  ' + record.name
+			lines.append('%-24s %6d %12.6f %12.6f %14d' % (name,record.calls,record.wall_time,\
+				record.cpu_time,record.array_bytes))
+		return '\n'.join(lines)
+
+class Stage:
+	"""
+	context manager timing one call of a stage
+	"""
+	def __init__(self,profiler,name):
+		self.profiler = profiler
+		self.record = StageRecord(name)
+
+	def output(self,*arrays):
+		"""
+		report the arrays produced by the stage
+		"""
+		self.record.array_bytes += sum(array.nbytes for array in arrays)
+		self.record.array_shape = arrays[-1].shape
+
+	def __enter__(self):
+		stack = self.profiler.stack
+		self.record.parent = stack[-1].record.name if stack else None
+		stack.append(self)
+		if self.profiler.trace_memory:
+			current, peak = tracemalloc.get_traced_memory()
+			# hand the peak reached so far to the enclosing stages before restarting it
+			for stage in stack[:-1]:
+				stage.peak = max(stage.peak,peak)
+			self.memory_start = current
+			self.peak = current
+			self.child_peak_bytes = 0
+			tracemalloc.reset_peak()
+		self.wall_start = time.perf_counter()
+		self.cpu_start = time.process_time()
+		return self
+
+	def __exit__(self,*exc_info):
+		record = self.record
+		record.wall_time = time.perf_counter() - self.wall_start
+		record.cpu_time = time.process_time() - self.cpu_start
+		record.calls = 1
+		if self.profiler.trace_memory:
+			current, peak = tracemalloc.get_traced_memory()
+			self.peak = max(self.peak,peak)
+			record.allocated_bytes = current - self.memory_start
+			# a stage that started after its parent freed memory can see a larger relative peak
+			record.peak_bytes = max(self.peak - self.memory_start,self.child_peak_bytes)
+		self.profiler.stack.pop()
+		if self.profiler.trace_memory and self.profiler.stack:
+			parent = self.profiler.stack[-1]
+			parent.peak = max(parent.peak,self.peak)
+			parent.child_peak_bytes = max(parent.child_peak_bytes,record.peak_bytes)
+		self.profiler.report.add(record)
+		if self.profiler.callback is not None:
+			self.profiler.callback(record)
+		return False
+
+class StageProfiler:
+	"""
+	records wall time, cpu time, array sizes and optionally allocated memory
+	of every stage into report, and calls callback(record) after each stage
+	"""
+	def __init__(self,callback=None,trace_memory=False):
+		self.callback = callback
+		self.trace_memory = trace_memory
+		self.report = ProfileReport()
+		self.stack = []
+		if trace_memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+
+	def stage(self,name):
+		return Stage(self,name)
+
+class _NullStage:
+	def output(self,*arrays):
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self,*exc_info):
+		return False
+
+class NullProfiler:
+	"""
+	profiler used when instrumentation is disabled, every stage is a shared no-op
+	"""
+	report = None
+	_stage = _NullStage()
+
+	def stage(self,name):
+		return self._stage
+
+NULL_PROFILER = NullProfiler()
@@ -7,47 +7,253 @@ star only
 star + planet
 star obscured by planet
 """
+import hashlib
+import io
+import os
+import re
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np 
-import matplotlib.pyplot as plt 
+import plotting
+
+_pandas = []
+
+def load_pandas():
+	"""
+	return the pandas module or None when it is not installed, imported on
+	first use since it is slow to import and only needed to parse text files
+	"""
+	if not _pandas:
+		try:
+			import pandas
+		except ImportError:
+			pandas = None
+		_pandas.append(pandas)
+	return _pandas[0]
+
+def binary_path(text_path):
+	"""
+	path of the binary copy written by convert_to_binary
+	"""
+	return text_path + '.npy'
+
+# a line starting with anything but blanks or a comment
+_DATA_LINE = re.compile(rb'^[ \t]*[^#\s]',re.MULTILINE)
+
+def parse_text(file_path,n_threads=None):
+	"""
+	parse the first two whitespace separated columns of a text spectra file,
+	lines starting with # are comments
+
+	with pandas installed the file is split at line boundaries and the pieces
+	are parsed by n_threads threads (os.cpu_count() by default) with the C
+	parser of pandas, whose round trip float conversion gives the same values
+	as np.loadtxt; otherwise np.loadtxt is used
+	return an array of shape (2, n_rows)
+	"""
+	pandas = load_pandas()
+	if pandas is None:
+		return np.loadtxt(file_path,comments='#',delimiter=None,skiprows=0,usecols=(0,1),unpack=True)
+	with open(file_path,'rb') as f:
+		text = f.read()
+	n_threads = n_threads or os.cpu_count() or 1
+	# split into pieces ending at a newline
+	bounds = [0]
+	for i in range(1,n_threads):
+		end = text.find(b'\n',max(bounds[-1],len(text)*i//n_threads))
+		if end < 0:
+			break
+		bounds.append(end+1)
+	bounds.append(len(text))
+	# pieces holding only blank or comment lines have nothing for pandas to parse
+	pieces = [text[start:end] for start,end in zip(bounds[:-1],bounds[1:]) \
+		if _DATA_LINE.search(text,start,end)]
+	if not pieces:
+		return np.zeros((2,0))
+
+	def parse(piece):
+		return pandas.read_csv(io.BytesIO(piece),sep=r'\s+',comment='#',header=None,\
+			usecols=[0,1],dtype=np.float64,engine='c',float_precision='round_trip').to_numpy()
+
+	with ThreadPoolExecutor(max(len(pieces),1)) as executor:
+		columns = list(executor.map(parse,pieces))
+	return np.ascontiguousarray(np.concatenate(columns).T)
+
+def convert_to_binary(text_path,output_path=None):
+	"""
+	convert a text spectra file into a .npy file holding a (2, n_rows) float64
+	array, so each column is contiguous and can be memory-mapped by Read
+	output_path defaults to binary_path(text_path), which Read finds automatically
+	return the path of the binary file
+	"""
+	if output_path is None:
+		output_path = binary_path(text_path)
+	columns = parse_text(text_path)
+	tmp_path = output_path + '.%d.tmp' % os.getpid()
+	with open(tmp_path,'wb') as f:
+		np.save(f,columns)
+	os.replace(tmp_path,output_path)
+	return output_path
+
+def read_columns(file_path):
+	"""
+	read the first two columns of a spectra file
+	.npy files, and text files with an up to date binary copy next to them,
+	are memory-mapped without copying, other files are parsed as text
+	return the two columns
+	"""
+	if not file_path.endswith('.npy'):
+		candidate = binary_path(file_path)
+		if os.path.exists(candidate) and os.path.getmtime(candidate) >= os.path.getmtime(file_path):
+			file_path = candidate
+	if file_path.endswith('.npy'):
+		columns = np.load(file_path,mmap_mode='r')
+	else:
+		columns = parse_text(file_path)
+	return columns[0], columns[1]
+
+def _release_segment(segment,owner):
+	try:
+		segment.close()
+	except BufferError:
+		# arrays still view the segment, the mapping goes away with the process
+		pass
+	if owner:
+		try:
+			segment.unlink()
+		except FileNotFoundError:
+			pass
+
+class SharedColumns:
+	"""
+	the columns of a spectra in one multiprocessing.shared_memory segment,
+	pickled as the segment name so other processes attach without copying
+
+	the publishing process owns the segment, it is unlinked by release(),
+	when the object is garbage collected or at interpreter exit
+	"""
+	def __init__(self,columns=None,name=None,shape=None,content_hash=None):
+		"""
+		columns: (n_columns, n_rows) array to publish
+		name, shape, content_hash: attach to the published segment instead
+		"""
+		self.owner = name is None
+		if self.owner:
+			columns = np.asarray(columns,dtype=np.float64)
+			shape = columns.shape
+			self.segment = shared_memory.SharedMemory(create=True,size=max(columns.nbytes,1))
+		else:
+			self.segment = shared_memory.SharedMemory(name=name)
+		self._finalizer = weakref.finalize(self,_release_segment,self.segment,self.owner)
+		self.columns = np.ndarray(shape,dtype=np.float64,buffer=self.segment.buf)
+		if self.owner:
+			self.columns[...] = columns
+		self.columns.setflags(write=False)
+		self.content_hash = content_hash
+
+	def __reduce__(self):
+		return (SharedColumns,(None,self.segment.name,self.columns.shape,self.content_hash))
+
+	def release(self):
+		self._finalizer()
+
+class SpectraData:
+	"""
+	two column spectra, base of TransitData and EmergentData
+	"""
+	# attribute names of the wavelength and value columns
+	columns = ()
+
+	def content_hash(self):
+		"""
+		sha1 of the columns, computed once
+		"""
+		if getattr(self,'_content_hash',None) is None:
+			sha1 = hashlib.sha1()
+			for name in self.columns:
+				sha1.update(np.ascontiguousarray(getattr(self,name),dtype=np.float64))
+			self._content_hash = sha1.hexdigest()
+		return self._content_hash
+
+	def Publish(self):
+		"""
+		move the columns into shared memory, pickling the object (e.g. to
+		pool workers) then only sends the segment name and the workers view
+		the same memory read only
+		return self
+		"""
+		if getattr(self,'_shared',None) is None:
+			self._shared = SharedColumns(np.stack([getattr(self,name) for name in self.columns]),\
+				content_hash=self.content_hash())
+			for name,column in zip(self.columns,self._shared.columns):
+				setattr(self,name,column)
+		return self
+
+	def Release(self):
+		"""
+		unlink the shared memory of a published object, the columns are
+		copied back to private memory
+		"""
+		shared = getattr(self,'_shared',None)
+		if shared is not None:
+			for name in self.columns:
+				setattr(self,name,np.array(getattr(self,name)))
+			self._shared = None
+			shared.release()
+
+	def __enter__(self):
+		return self.Publish()
+
+	def __exit__(self,*exc_info):
+		self.Release()
+
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		if state.get('_shared') is not None:
+			for name in self.columns:
+				del state[name]
+		return state
+
+	def __setstate__(self,state):
+		self.__dict__.update(state)
+		if state.get('_shared') is not None:
+			for name,column in zip(self.columns,self._shared.columns):
+				setattr(self,name,column)
+
+class TransitData(SpectraData):
+	columns = ('wavelength','depth')
 
-class TransitData:
 	def __init__(self,wavelength=None,depth=None):
 		self.wavelength = wavelength
 		self.depth = depth
 
 	def Read(self,transit_file_path):
-		[self.wavelength, self.depth] = np.loadtxt(transit_file_path, \
-		comments='#', delimiter=None, \
-		skiprows=0, usecols=(0,1), unpack=True)
+		self.wavelength, self.depth = read_columns(transit_file_path)
 
 
 	def Plot(self,**kwargs):
-		fig = plt.figure()
-		ax = fig.add_subplot(111)
-		ax.plot(self.wavelength,self.depth,**kwargs)
-		return ax
+		return plotting.plot_data(self.wavelength,self.depth,**kwargs)
+
+class EmergentData(SpectraData):
+	columns = ('wavelength','flux_per_wavelength')
 
-class EmergentData:
 	def __init__(self,wavelength=None,flux_per_wavelength=None):
 		self.wavelength = wavelength
 		self.flux_per_wavelength = flux_per_wavelength
 
 	def Read(self,emergent_file_path):
-		[self.wavelength, self.flux_per_wavelength] = np.loadtxt(emergent_file_path, \
-		comments='#', delimiter=None, \
-		skiprows=0, usecols=(0,1), unpack=True)
+		self.wavelength, self.flux_per_wavelength = read_columns(emergent_file_path)
 
 
 	def Plot(self,**kwargs):
-		fig = plt.figure()
-		ax = fig.add_subplot(111)
-		ax.plot(self.wavelength,self.flux_per_wavelength,**kwargs)
-		return ax
+		return plotting.plot_data(self.wavelength,self.flux_per_wavelength,**kwargs)
 
 if __name__ == '__main__':
 	"""
 	test the module
 	"""
+	plt = plotting.pyplot()
 	path = '/Users/wangdong/Documents/research/spectra_project/spectra_data/'+\
 	'CNOSP_500K_G_star_1e9/include_all/res_100/spectra-CNOSP500.TRANSIT-IR-Res100'
 	transit_data = TransitData()
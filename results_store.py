@@ -0,0 +1,324 @@
+"""
+columnar store appending many transit and secondary eclipse spectra to one
+file, with the input parameters of every spectrum
+
+spectra have different numbers of bins, so the per bin columns
+(binned_wavelength, mean, sigma) of all spectra are concatenated and each
+spectrum row holds the offset and n_bins of its slice. optional noise
+realizations of shape (n_realizations, n_bins) are stored flattened the
+same way
+
+two backends:
+- a path ending with .h5 or .hdf5 is an HDF5 file (needs h5py) with chunked,
+  gzip compressed, resizable datasets
+- any other path is a directory holding one raw binary file per numeric
+  column, which is read back with np.memmap, and a meta.json with the
+  column lengths. an append only becomes visible once meta.json is
+  replaced, so a crash mid append leaves the previous spectra intact.
+  with compression='zlib' every append of a numeric column is written as
+  one zlib compressed segment instead, a read then only decompresses the
+  segments it overlaps but cannot be memory mapped
+text columns are JSON lines with an index of their line ends, so single
+rows are read without parsing the whole column
+
+this module only needs numpy, so that loaders stay light
+"""
+import json
+import os
+import tempfile
+import zlib
+import numpy as np
+
+# scalar job parameters copied into every row of the output table
+TABLE_PARAMETERS = ('d','R_p','A_tel','tau','R','n_ints','t','n_instance')
+# per spectrum numeric columns, parameters missing from a spectrum are nan
+PARAMETERS = TABLE_PARAMETERS + ('binned_wavelength_min','binned_wavelength_max')
+SPECTRUM_COLUMNS = dict([(name,np.float64) for name in PARAMETERS] + \
+	[('offset',np.int64),('n_bins',np.int64),('realization_offset',np.int64),('n_realizations',np.int64)])
+# per spectrum text columns, parameters holds the JSON of all input parameters
+TEXT_COLUMNS = ('kind','file_path','parameters')
+# concatenated per bin and per realization columns
+BIN_COLUMNS = dict(binned_wavelength=np.float64,mean=np.float64,sigma=np.float64)
+REALIZATION_COLUMNS = dict(realizations=np.float64)
+# layout of directory stores, bumped whenever the files change incompatibly
+FORMAT = 2
+
+def _json_default(value):
+	if isinstance(value,np.ndarray):
+		return value.tolist()
+	if isinstance(value,np.generic):
+		return value.item()
+	return str(value)
+
+class DirectoryBackend:
+	"""
+	raw binary or zlib compressed columns plus meta.json in a directory
+	"""
+	def __init__(self,path,compression=None):
+		if compression not in (None,'zlib'):
+			raise ValueError("compression must be None or 'zlib', got %r" % (compression,))
+		self.path = path
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		self.meta_path = os.path.join(path,'meta.json')
+		if os.path.exists(self.meta_path):
+			with open(self.meta_path) as f:
+				self.meta = json.load(f)
+			if self.meta.get('format') != FORMAT:
+				raise ValueError('%s is a format %r store, this version reads format %d only' % \
+					(path,self.meta.get('format'),FORMAT))
+		else:
+			self.meta = dict(format=FORMAT,lengths={},sizes={},compression=compression,segments={})
+		self.compression = self.meta['compression']
+
+	def _file(self,name,kind):
+		return os.path.join(self.path,name + dict(text='.txt',index='.idx',raw='.bin',zlib='.zbin')[kind])
+
+	def length(self,name):
+		return self.meta['lengths'].get(name,0)
+
+	def _write(self,meta,key,kind,data):
+		"""
+		append data to the file of key after its committed size
+		return the offset of data in the file
+		"""
+		size = meta['sizes'].get(key,0)
+		# drop whatever an interrupted append left after the committed size
+		with open(self._file(key.split(':')[0],kind),'ab') as f:
+			f.truncate(size)
+			f.write(data)
+		meta['sizes'][key] = size + len(data)
+		return size
+
+	def append(self,columns):
+		"""
+		columns: dict of name -> 1-D array (numeric) or list of str (text)
+		"""
+		meta = json.loads(json.dumps(self.meta))
+		for name,values in columns.items():
+			n = meta['lengths'].get(name,0)
+			if not isinstance(values,np.ndarray):
+				lines = [(json.dumps(value) + '\n').encode() for value in values]
+				offset = self._write(meta,name,'text',b''.join(lines))
+				ends = offset + np.cumsum([len(line) for line in lines],dtype=np.int64)
+				self._write(meta,name + ':index','index',ends.astype('<i8').tobytes())
+			else:
+				data = np.ascontiguousarray(values,dtype=values.dtype.newbyteorder('<')).tobytes()
+				if self.compression == 'zlib':
+					data = zlib.compress(data)
+					offset = self._write(meta,name,'zlib',data)
+					meta['segments'].setdefault(name,[]).append([n,len(values),offset,len(data)])
+				else:
+					self._write(meta,name,'raw',data)
+			meta['lengths'][name] = n + len(values)
+		fd, tmp_path = tempfile.mkstemp(suffix='.json',dir=self.path)
+		with os.fdopen(fd,'w') as f:
+			json.dump(meta,f)
+		os.replace(tmp_path,self.meta_path)
+		self.meta = meta
+
+	def read(self,name,dtype=None,start=0,stop=None):
+		"""
+		numeric columns are returned as a read only memmap when not compressed
+		"""
+		n = self.length(name)
+		stop = n if stop is None else min(stop,n)
+		if dtype is None:
+			return self._read_text(name,start,stop)
+		dtype = np.dtype(dtype).newbyteorder('<')
+		if stop <= start:
+			return np.zeros(0,dtype=dtype)
+		if name in self.meta['segments']:
+			return self._read_segments(name,dtype,start,stop)
+		return np.memmap(self._file(name,'raw'),dtype=dtype,mode='r',\
+			offset=start*dtype.itemsize,shape=(stop-start,))
+
+	def _read_text(self,name,start,stop):
+		if stop <= start:
+			return []
+		ends = np.memmap(self._file(name,'index'),dtype='<i8',mode='r',shape=(self.length(name),))
+		begin = int(ends[start-1]) if start > 0 else 0
+		with open(self._file(name,'text'),'rb') as f:
+			f.seek(begin)
+			lines = f.read(int(ends[stop-1]) - begin).decode().splitlines()
+		return [json.loads(line) for line in lines]
+
+	def _read_segments(self,name,dtype,start,stop):
+		out = np.empty(stop-start,dtype=dtype)
+		with open(self._file(name,'zlib'),'rb') as f:
+			for first,count,offset,size in self.meta['segments'][name]:
+				if first >= stop or first + count <= start:
+					continue
+				f.seek(offset)
+				values = np.frombuffer(zlib.decompress(f.read(size)),dtype=dtype)
+				lo, hi = max(start,first), min(stop,first+count)
+				out[lo-start:hi-start] = values[lo-first:hi-first]
+		return out
+
+class HDF5Backend:
+	"""
+	chunked, compressed, resizable datasets in an HDF5 file
+	"""
+	def __init__(self,path,chunk_size=65536,compression='gzip'):
+		import h5py
+		self.h5py = h5py
+		self.path = path
+		self.chunk_size = chunk_size
+		self.compression = compression
+		with h5py.File(path,'a'):
+			pass
+
+	def _lengths(self,f):
+		return json.loads(f.attrs.get('lengths','{}'))
+
+	def length(self,name):
+		with self.h5py.File(self.path,'r') as f:
+			return self._lengths(f).get(name,0)
+
+	def append(self,columns):
+		"""
+		like DirectoryBackend.append, the committed lengths are kept in the
+		lengths attribute which is written last
+		"""
+		with self.h5py.File(self.path,'a') as f:
+			lengths = self._lengths(f)
+			for name,values in columns.items():
+				if isinstance(values,np.ndarray):
+					dtype = values.dtype
+				else:
+					dtype = self.h5py.string_dtype()
+					values = np.array(values,dtype=object)
+				if name not in f:
+					f.create_dataset(name,shape=(0,),maxshape=(None,),dtype=dtype,\
+						chunks=(self.chunk_size,),compression=self.compression,shuffle=True)
+				dataset = f[name]
+				n = lengths.get(name,0)
+				dataset.resize((n+len(values),))
+				dataset[n:] = values
+				lengths[name] = n + len(values)
+			f.attrs['lengths'] = json.dumps(lengths)
+
+	def read(self,name,dtype=None,start=0,stop=None):
+		with self.h5py.File(self.path,'r') as f:
+			if name not in f:
+				return [] if dtype is None else np.zeros(0,dtype=dtype)
+			n = self._lengths(f).get(name,0)
+			stop = n if stop is None else min(stop,n)
+			dataset = f[name]
+			if dtype is None:
+				return list(dataset.asstr()[start:stop])
+			return dataset[start:stop]
+
+class ResultsStore:
+	"""
+	append only store of spectra, see the module docstring
+	"""
+	def __init__(self,path,compression=None):
+		"""
+		compression: None or 'zlib' for a new directory store, an existing
+		             store keeps the compression it was created with; HDF5
+		             stores are always gzip compressed
+		"""
+		if os.path.splitext(path)[1].lower() in ('.h5','.hdf5'):
+			self.backend = HDF5Backend(path)
+		else:
+			self.backend = DirectoryBackend(path,compression)
+		self.path = path
+
+	def __len__(self):
+		return self.backend.length('offset')
+
+	def append(self,kind,file_path,parameters,binned_wavelength,mean,sigma,realizations=None):
+		"""
+		kind: 'transit' or 'secondary'
+		parameters: dict of input parameters, the PARAMETERS get their own
+		            column and the whole dict is kept as JSON
+		realizations: optional (n_realizations, n_bins) noise realizations
+		"""
+		self.extend([(kind,file_path,parameters,binned_wavelength,mean,sigma,realizations)])
+
+	def append_spectra(self,spectra,file_path,parameters,realizations=None):
+		"""
+		append a computed TransitSpectra or SecondarySpectra
+		"""
+		if hasattr(spectra,'mean_depth'):
+			kind, mean = 'transit', spectra.mean_depth
+		else:
+			kind, mean = 'secondary', spectra.mean_ratio
+		self.append(kind,file_path,parameters,spectra.binned_wavelength,mean,spectra.sigma,realizations)
+
+	def extend(self,rows):
+		"""
+		append many spectra in one write
+		rows: iterable of (kind, file_path, parameters, binned_wavelength, mean, sigma, realizations)
+		"""
+		rows = list(rows)
+		if not rows:
+			return
+		offset = self.backend.length('binned_wavelength')
+		realization_offset = self.backend.length('realizations')
+		columns = dict((name,np.zeros(len(rows),dtype=dtype)) for name,dtype in SPECTRUM_COLUMNS.items())
+		text = dict((name,[]) for name in TEXT_COLUMNS)
+		bins = dict((name,[]) for name in BIN_COLUMNS)
+		realization_values = []
+		for i,(kind,file_path,parameters,binned_wavelength,mean,sigma,realizations) in enumerate(rows):
+			n_bins = len(binned_wavelength)
+			for name in PARAMETERS:
+				columns[name][i] = parameters.get(name,np.nan)
+			columns['offset'][i] = offset
+			columns['n_bins'][i] = n_bins
+			columns['realization_offset'][i] = realization_offset
+			text['kind'].append(kind)
+			text['file_path'].append(str(file_path))
+			text['parameters'].append(json.dumps(parameters,sort_keys=True,default=_json_default))
+			bins['binned_wavelength'].append(np.asarray(binned_wavelength,dtype=np.float64))
+			bins['mean'].append(np.broadcast_to(np.asarray(mean,dtype=np.float64),(n_bins,)))
+			bins['sigma'].append(np.broadcast_to(np.asarray(sigma,dtype=np.float64),(n_bins,)))
+			if realizations is not None:
+				realizations = np.asarray(realizations,dtype=np.float64).reshape(-1,n_bins)
+				columns['n_realizations'][i] = len(realizations)
+				realization_values.append(realizations.ravel())
+				realization_offset += realizations.size
+			offset += n_bins
+		for name in bins:
+			columns[name] = np.concatenate(bins[name])
+		if realization_values:
+			columns['realizations'] = np.concatenate(realization_values)
+		columns.update(text)
+		self.backend.append(columns)
+
+	def column(self,name,start=0,stop=None):
+		"""
+		read one column, per spectrum or concatenated per bin, without
+		touching the others
+		"""
+		if name in TEXT_COLUMNS:
+			return self.backend.read(name,None,start,stop)
+		dtype = dict(SPECTRUM_COLUMNS,**BIN_COLUMNS)
+		dtype.update(REALIZATION_COLUMNS)
+		if name not in dtype:
+			raise KeyError('unknown column %r' % (name,))
+		return self.backend.read(name,dtype[name],start,stop)
+
+	def spectrum(self,i):
+		"""
+		return binned_wavelength, mean, sigma of spectrum i
+		"""
+		offset = int(self.column('offset',i,i+1)[0])
+		n_bins = int(self.column('n_bins',i,i+1)[0])
+		return tuple(np.asarray(self.column(name,offset,offset+n_bins)) for name in ('binned_wavelength','mean','sigma'))
+
+	def realizations(self,i):
+		"""
+		return the (n_realizations, n_bins) realizations of spectrum i
+		"""
+		offset = int(self.column('realization_offset',i,i+1)[0])
+		n = int(self.column('n_realizations',i,i+1)[0])
+		n_bins = int(self.column('n_bins',i,i+1)[0])
+		return np.asarray(self.column('realizations',offset,offset+n*n_bins)).reshape(n,n_bins)
+
+	def parameters(self,i):
+		"""
+		return the dict of input parameters of spectrum i
+		"""
+		return json.loads(self.column('parameters',i,i+1)[0])
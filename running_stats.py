@@ -0,0 +1,174 @@
+"""
+streaming statistics of noisy spectra realizations
+"""
+import numpy as np 
+
+class RunningStatistics:
+	"""
+	accumulate mean and variance along the first axis chunk by chunk,
+	chunks are merged with the pairwise update of Chan et al. so the memory
+	does not grow with the number of realizations and the variance does not
+	suffer from the cancellation of sum(x^2)/n - mean^2
+	"""
+	def __init__(self,percentiles=None,n_hist=1024,hist_width=8.,kurtosis=False):
+		"""
+		percentiles: optional list of percentiles (0-100) to estimate
+		n_hist: even number of histogram bins per element used for the percentiles
+		hist_width: half width of the histogram in units of the standard deviation
+		            of the first chunk, the range of an element is doubled by
+		            merging pairs of bins whenever a later chunk falls outside it
+		kurtosis: also accumulate the third and fourth central moments, needed
+		          for the standard error of sigma of non gaussian samples
+		"""
+		if percentiles is not None and n_hist % 2:
+			raise ValueError('n_hist must be even, got %d' % n_hist)
+		self.n = 0
+		self.mean = None
+		self.m2 = None
+		self.m3 = None
+		self.m4 = None
+		self.percentiles = percentiles
+		self.n_hist = n_hist
+		self.hist_width = hist_width
+		self.hist = None
+		self.kurtosis = kurtosis
+
+	def update(self,x,index=None):
+		"""
+		x: array of shape (n_chunk,) + element shape
+		index: optional indices along the last element axis that x holds,
+		       x then has shape (n_chunk,) + element shape[:-1] + (len(index),)
+		       and n becomes an array counting the samples of every element
+		"""
+		n_b = x.shape[0]
+		if n_b == 0:
+			return
+		# moments of the chunk are always accumulated in float64, the deviations
+		# stay in the dtype of x
+		mean_b = x.mean(axis=0,dtype=np.float64)
+		deviation = x - mean_b.astype(x.dtype)
+		m2_b = (deviation**2).sum(axis=0,dtype=np.float64)
+		if self.kurtosis:
+			m3_b = (deviation**3).sum(axis=0,dtype=np.float64)
+			m4_b = (deviation**4).sum(axis=0,dtype=np.float64)
+		if self.mean is None:
+			if index is not None:
+				raise ValueError('the first chunk must hold every element')
+			self.mean = mean_b
+			self.m2 = m2_b
+			if self.kurtosis:
+				self.m3 = m3_b
+				self.m4 = m4_b
+			self.n = n_b
+			if self.percentiles is not None:
+				self._update_hist(x)
+			return
+		if index is None:
+			key = Ellipsis
+		else:
+			key = (Ellipsis,index)
+			if np.ndim(self.n) == 0:
+				self.n = np.full(self.mean.shape,self.n,dtype=np.int64)
+		# float counts, the cubes of int64 counts overflow past ~2e6 samples
+		n_a = np.asarray(self.n[key] if np.ndim(self.n) else self.n,dtype=np.float64)
+		n_b = float(n_b)
+		n = n_a + n_b
+		delta = mean_b - self.mean[key]
+		m2_a = self.m2[key]
+		if self.kurtosis:
+			# pairwise update of the higher moments of Pebay
+			m3_a = self.m3[key]
+			self.m4[key] = self.m4[key] + m4_b + delta**4*(n_a*n_b*(n_a*n_a - n_a*n_b + n_b*n_b)/n**3) \
+				+ 6*delta**2*(n_a*n_a*m2_b + n_b*n_b*m2_a)/n**2 + 4*delta*(n_a*m3_b - n_b*m3_a)/n
+			self.m3[key] = m3_a + m3_b + delta**3*(n_a*n_b*(n_a - n_b)/n**2) + 3*delta*(n_a*m2_b - n_b*m2_a)/n
+		self.mean[key] = self.mean[key] + delta*(n_b/n)
+		self.m2[key] = m2_a + m2_b + delta*delta*(n_a*n_b/n)
+		if np.ndim(self.n):
+			self.n[key] += x.shape[0]
+		else:
+			self.n += x.shape[0]
+		if self.percentiles is not None:
+			self._update_hist(x,key)
+
+	@property
+	def variance(self):
+		return self.m2/self.n
+
+	@property
+	def sigma(self):
+		return np.sqrt(self.variance)
+
+	@property
+	def standard_error(self):
+		"""
+		standard error of the mean
+		"""
+		return self.sigma/np.sqrt(self.n)
+
+	@property
+	def sigma_standard_error(self):
+		"""
+		standard error of sigma from the delta method, var(s^2) = (m4 - s^4)/n,
+		the gaussian value sigma/sqrt(2(n-1)) without the fourth moment
+		"""
+		if not self.kurtosis:
+			return self.sigma/np.sqrt(2*np.maximum(self.n-1,1))
+		variance = self.variance
+		return np.sqrt(np.maximum(self.m4/self.n - variance*variance,0.)/self.n)/(2*np.sqrt(variance))
+
+	def _update_hist(self,x,key=Ellipsis):
+		if self.hist is None:
+			# the histogram range starts from the spread of the first chunk
+			half_width = self.hist_width*self.sigma
+			half_width[half_width == 0] = np.maximum(np.abs(self.mean[half_width == 0])*1e-12,1e-300)
+			self.hist_min = self.mean - half_width
+			self.hist_step = 2*half_width/self.n_hist
+			self.hist = np.zeros(self.mean.shape+(self.n_hist,),dtype=np.int64)
+		self._widen_hist(x,key)
+		index = np.floor((x - self.hist_min[key])/self.hist_step[key]).astype(np.int64)
+		np.clip(index,0,self.n_hist-1,out=index)
+		index += np.arange(self.mean.size).reshape(self.mean.shape)[key]*self.n_hist
+		self.hist += np.bincount(index.ravel(),minlength=self.hist.size).reshape(self.hist.shape)
+
+	def _widen_hist(self,x,key):
+		"""
+		double the histogram range of every element that x leaves, downwards or
+		upwards, until x fits, merging pairs of bins so the bin edges stay aligned
+		"""
+		finite = np.isfinite(x)
+		lo = np.where(finite,x,np.inf).min(axis=0).ravel()
+		hi = np.where(finite,x,-np.inf).max(axis=0).ravel()
+		elements = np.arange(self.mean.size).reshape(self.mean.shape)[key].ravel()
+		hist = self.hist.reshape(-1,self.n_hist)
+		hist_min = self.hist_min.reshape(-1)
+		hist_step = self.hist_step.reshape(-1)
+		half = self.n_hist//2
+		while True:
+			below = lo < hist_min[elements]
+			above = hi >= hist_min[elements] + self.n_hist*hist_step[elements]
+			grow = below | above
+			if not np.any(grow):
+				return
+			lo, hi, elements, down = lo[grow], hi[grow], elements[grow], below[grow]
+			merged = hist[elements].reshape(-1,half,2).sum(axis=-1)
+			widened = np.zeros((len(elements),self.n_hist),dtype=np.int64)
+			widened[~down,:half] = merged[~down]
+			widened[down,half:] = merged[down]
+			hist[elements] = widened
+			hist_min[elements] -= np.where(down,self.n_hist*hist_step[elements],0.)
+			hist_step[elements] *= 2
+
+	def percentile(self,q):
+		"""
+		estimate the q-th percentile (0-100) of each element from the histogram
+		"""
+		if self.hist is None:
+			raise ValueError('percentiles were not requested')
+		cdf = np.cumsum(self.hist,axis=-1)
+		target = q/100.*np.asarray(self.n)[...,np.newaxis]
+		# first histogram bin whose cumulative count reaches the target
+		index = np.minimum((cdf < target).sum(axis=-1),self.n_hist-1)
+		count = np.take_along_axis(self.hist,index[...,np.newaxis],axis=-1)[...,0]
+		below = np.take_along_axis(cdf,index[...,np.newaxis],axis=-1)[...,0] - count
+		fraction = np.clip((target[...,0] - below)/np.maximum(count,1),0.,1.)
+		return self.hist_min + (index + fraction)*self.hist_step
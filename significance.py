@@ -0,0 +1,145 @@
+"""
+detection significance of model pairs, e.g. an atmosphere with and without
+a molecule, over a library of models and many observing configurations
+"""
+import numpy as np
+from scipy.special import chdtrc, gammaln, ndtri
+from star import Star
+from source_flux import flux_dilution
+from read_data import TransitData, EmergentData
+from binned_photon_energy import Binning, BinnedTransitPhotonNumber, BinnedJWSTBackgroundPhotonEnergy
+from detector_noise import DetectorNoise
+from sys_noise import SysNoise
+from noise_engine import NoiseEngine
+from error_propagation import ratio_moments
+
+def delta_chi2(mean_true,mean_alternative,sigma):
+	"""
+	chi^2 of the alternative spectra against data drawn around the true one,
+	summed over the last (bin) axis, nan bins are skipped
+	"""
+	return np.nansum(((mean_true - mean_alternative)/sigma)**2,axis=-1)
+
+def n_sigma(delta_chi2,dof=1):
+	"""
+	gaussian equivalent (two sided) significance of delta_chi2 with dof
+	degrees of freedom, sqrt(delta_chi2) for one degree of freedom
+	"""
+	delta_chi2 = np.asarray(delta_chi2,dtype=float)
+	if dof == 1:
+		return np.sqrt(delta_chi2)
+	p = chdtrc(dof,delta_chi2)
+	with np.errstate(divide='ignore'):
+		significance = -ndtri(p/2)
+	# p underflows far in the tail, use the asymptotic chi^2 and gaussian tails there
+	k = dof/2.
+	with np.errstate(divide='ignore',invalid='ignore'):
+		log_q = (k-1)*np.log(delta_chi2/2) - delta_chi2/2 - gammaln(k) - np.log(2)
+		tail = np.sqrt(-2*log_q - np.log(-2*log_q) - np.log(2*np.pi))
+	return np.where(p > 0,significance,tail)
+
+def load_models(kind,file_paths):
+	"""
+	read a library of transit (depth) or emergent (flux) spectra files and
+	interpolate them on the wavelength of the first one
+	return wavelength, models of shape (n_models, n_wavelength)
+	"""
+	data = []
+	for file_path in file_paths:
+		spectra = TransitData() if kind == 'transit' else EmergentData()
+		spectra.Read(file_path)
+		order = np.argsort(spectra.wavelength)
+		data.append((np.asarray(spectra.wavelength)[order],np.asarray(getattr(spectra,spectra.columns[1]))[order]))
+	wavelength = data[0][0]
+	return wavelength, np.array([np.interp(wavelength,w,y) for w,y in data])
+
+class SignificanceGrid:
+	"""
+	delta chi^2 and n sigma significance of model pairs for many combinations
+	of d, A_tel, tau, R, n_ints and t, from the analytic (delta method) mean
+	and sigma of every model, see error_propagation.ratio_moments
+	"""
+	dims = ('d','A_tel','tau','R','n_ints','t')
+
+	def Compute(self,kind,wavelength,models,pairs,d,\
+		A_tel,tau,R,noise_floor,binned_wavelength_min,binned_wavelength_max,\
+		n_ints,t,R_p=None,grid=True,dof=1,binning_mode='interpolate',star=None,chunk_size=256):
+		"""
+		kind: 'transit' (models are depths) or 'secondary' (models are planetary
+		      flux per wavelength in W/m^2/m, R_p is then required)
+		wavelength: wavelength grid in micron shared by the models
+		models: array of shape (n_models, n_wavelength)
+		pairs: (n_pairs, 2) model indices (true, alternative), the data are
+		       drawn around the true model and tested against the alternative
+		R_p: planetary radius, scalar or one per model
+		d, A_tel, tau, R, n_ints, t: scalars or arrays, see sweep.TransitSweep
+		grid: cartesian product of the parameters when True, broadcast otherwise
+		dof: degrees of freedom of the n sigma conversion
+		star: Star of the host, a solar blackbody by default
+		chunk_size: configurations evaluated at once, bounds the memory to
+		            chunk_size*n_models*n_bins
+
+		the results are stored in
+		delta_chi2, n_sigma: arrays of shape (parameter shape) + (n_pairs,)
+		coords: dict of the parameter values as in sweep.TransitSweep
+		"""
+		if kind not in ('transit','secondary'):
+			raise ValueError("kind must be 'transit' or 'secondary', got %r" % (kind,))
+		if kind == 'secondary' and R_p is None:
+			raise ValueError('R_p is required for secondary eclipses')
+		models = np.atleast_2d(np.asarray(models,dtype=float))
+		self.pairs = np.atleast_2d(np.asarray(pairs,dtype=int))
+		params = [np.atleast_1d(np.asarray(p,dtype=float)) for p in (d,A_tel,tau,R,n_ints,t)]
+		if grid:
+			for p in params:
+				if p.ndim != 1:
+					raise ValueError('grid parameters must be scalars or 1d arrays')
+			self.coords = dict(zip(self.dims,params))
+			params = np.meshgrid(*params,indexing='ij')
+		else:
+			params = np.broadcast_arrays(*params)
+			self.coords = dict(zip(self.dims,params))
+		shape = params[0].shape
+		params = [p.ravel() for p in params]
+
+		star = star or Star()
+		L_star = star.Spectra(wavelength)
+		self.delta_chi2 = np.zeros((params[0].size,len(self.pairs)))
+		# the binning only depends on R
+		R_values, R_index = np.unique(params[3],return_inverse=True)
+		for i,R_value in enumerate(R_values):
+			binning_obj = Binning(wavelength,binned_wavelength_min,binned_wavelength_max,R_value,binning_mode)
+			binned_wavelength = binning_obj.binned_wavelength
+			L_star_bin = binning_obj.binning(L_star)
+			if kind == 'transit':
+				L_planet_bin = binning_obj.binning(L_star*(1-models))
+			else:
+				R_p_models = np.reshape(np.asarray(R_p,dtype=float),(-1,1))
+				L_planet_bin = binning_obj.binning(models)*(4*np.pi*R_p_models*R_p_models) + L_star_bin
+			sys_noise = SysNoise(binned_wavelength,noise_floor)
+			index = np.nonzero(R_index == i)[0]
+			for start in range(0,index.size,chunk_size):
+				rows = index[start:start+chunk_size]
+				self.delta_chi2[rows] = self._chunk(kind,binned_wavelength,L_star_bin,L_planet_bin,sys_noise,\
+					R_value,*[p[rows] for p in params[:3]+params[4:]])
+		self.delta_chi2 = self.delta_chi2.reshape(shape+(len(self.pairs),))
+		self.n_sigma = n_sigma(self.delta_chi2,dof)
+
+	def _chunk(self,kind,binned_wavelength,L_star_bin,L_planet_bin,sys_noise,R,d,A_tel,tau,n_ints,t):
+		"""
+		delta chi^2 of every pair for configurations sharing R, with axes
+		(configuration, model, bin)
+		"""
+		d, A_tel, tau, n_ints, t = [p[:,np.newaxis,np.newaxis] for p in (d,A_tel,tau,n_ints,t)]
+		dilution = flux_dilution(d)
+		photon_eqn = BinnedTransitPhotonNumber.source_photon_number_eqn
+		n_star_bin = photon_eqn(binned_wavelength*1e-6,L_star_bin*dilution,R,tau,A_tel)*t
+		n_planet_bin = photon_eqn(binned_wavelength*1e-6,L_planet_bin*dilution,R,tau,A_tel)*t
+		n_background = BinnedJWSTBackgroundPhotonEnergy(binned_wavelength,R,t).n_background
+		detector_noise = DetectorNoise(binned_wavelength,R,n_ints)
+		star_noise_engine = NoiseEngine(n_star_bin,n_background,detector_noise,sys_noise)
+		planet_noise_engine = NoiseEngine(n_planet_bin,n_background,detector_noise,sys_noise)
+		mean, sigma = ratio_moments(star_noise_engine.source,planet_noise_engine.source,\
+			star_noise_engine.sigma_total,planet_noise_engine.sigma_total,kind == 'transit')
+		true, alternative = self.pairs[:,0], self.pairs[:,1]
+		return delta_chi2(mean[:,true],mean[:,alternative],sigma[:,true])
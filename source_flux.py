@@ -7,11 +7,29 @@ from star import Star
 # 1 parsec to meters
 pc = 3.086e+16
 
+def flux_dilution(d):
+	"""
+	d: distance in pc
+	return the factor converting luminosity (W/m) into flux (W/m^2/m)
+	"""
+	return 1./(4*np.pi*(d*pc)**2)
+
+def per_star(value,L_star):
+	"""
+	give an array of per star values (d, R_p) a trailing wavelength axis when
+	L_star holds the spectra of many stars, shape (n_stars, n_wavelength)
+	"""
+	value = np.asarray(value,dtype=float)
+	if np.ndim(L_star) > 1 and value.ndim > 0:
+		return value[...,None]
+	return value
+
 class TransitFlux:
 	def __init__(self,transit_data,d,L_star):
 		"""
 		d is the distance from planeary system to the telescope in pc
-		L_star: W/m
+		L_star: W/m, one spectra or (n_stars, n_wavelength) stacked spectra
+		        with d a scalar or one distance per star
 
 		return
 		wavelength in micron 
@@ -19,20 +37,23 @@ class TransitFlux:
 		"""
 		self.wavelength = transit_data.wavelength
 		depth = transit_data.depth
-		self.f_star = L_star/(4*np.pi*(d*pc)**2)
+		self.f_star = L_star*flux_dilution(per_star(d,L_star))
 		self.f_in_transit = self.f_star*(1-depth)
 
 class SecondaryFlux:
 	def __init__(self,emergent_data,d,R_p,L_star):
 		"""
 		R_p is the planetary radius
+		L_star: W/m, one spectra or (n_stars, n_wavelength) stacked spectra
+		        with d and R_p scalars or one value per star
 		
 		return
 		wavelength in micron 
 		flux in W/m^2/m		"""
 		self.wavelength = emergent_data.wavelength
-		self.f_star = L_star/(4*np.pi*(d*pc)**2)
+		dilution = flux_dilution(per_star(d,L_star))
+		R_p = per_star(R_p,L_star)
+		self.f_star = L_star*dilution
 		planetary_flux = emergent_data.flux_per_wavelength
 		L_p = planetary_flux*(4*np.pi*R_p*R_p)
-		self.f_out_transit = (L_p + L_star)/(4*np.pi*(d*pc)**2)
-
+		self.f_out_transit = (L_p + L_star)*dilution
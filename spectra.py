@@ -1,12 +1,187 @@
-import matplotlib.pyplot as plt 
+import time
+import warnings
 import numpy as np 
-from read_data import TransitData, EmergentData
+from scipy.special import ndtri
 from star import Star
-from source_flux import TransitFlux, SecondaryFlux
-from binned_photon_energy import BinnedTransitPhotonNumber, BinnedSecondaryPhotonNumber, BinnedJWSTBackgroundPhotonEnergy
+from source_flux import flux_dilution
+from binned_photon_energy import Binning, BinnedTransitPhotonNumber, BinnedSecondaryPhotonNumber, BinnedJWSTBackgroundPhotonEnergy
 from detector_noise import DetectorNoise
 from sys_noise import SysNoise
 from noise_engine import NoiseEngine
+from running_stats import RunningStatistics
+from error_propagation import ratio_moments
+import flux_cache
+from profiling import NULL_PROFILER
+import plotting
+
+# largest rms error of the float32 ratio in units of its sigma, see check_precision
+FLOAT32_TOLERANCE = 1e-3
+
+def ratio_terms(star_engine,planet_engine,n_background,transit,dtype=np.float64):
+	"""
+	constant terms of the ratio computed by ratio_chunk, float64 draws hold
+	the full signals and only the background is removed, reduced precision
+	draws hold the noise alone (NoiseEngine.generate centered) and the
+	signals are added back after the large star and planet photon numbers
+	cancelled in float64
+	return numerator, denominator, centered
+	"""
+	if np.dtype(dtype) == np.float64:
+		return None, -np.broadcast_to(n_background,star_engine.shape), False
+	difference = star_engine.source - planet_engine.source
+	numerator = (difference if transit else -difference).astype(dtype)
+	denominator = np.broadcast_to(star_engine.source,star_engine.shape).astype(dtype)
+	return numerator, denominator, True
+
+def ratio_chunk(star,planet,transit,numerator,denominator):
+	"""
+	overwrite planet with (star - planet + numerator)/(star + denominator)
+	for transits or (planet - star + numerator)/(star + denominator) for
+	secondary eclipses, star is overwritten too
+	"""
+	if transit:
+		np.subtract(star,planet,out=planet)
+	else:
+		planet -= star
+	if numerator is not None:
+		planet += numerator
+	star += denominator
+	planet /= star
+	return planet
+
+def check_precision(star_engine,planet_engine,n_background,transit,dtype,n_pilot=256,seed=0):
+	"""
+	compute n_pilot ratios in float64 and in dtype from the same noise and
+	return the largest rms difference of a bin in units of its float64 sigma,
+	the random streams of the engines are not used
+	"""
+	rng = np.random.default_rng(seed)
+	shape = (n_pilot,) + star_engine.shape
+	star_noise = rng.standard_normal(shape)*star_engine.sigma_total
+	planet_noise = rng.standard_normal(shape)*planet_engine.sigma_total
+	exact = ratio_chunk(star_noise + (star_engine.source + star_engine.bkg),\
+		planet_noise + (planet_engine.source + planet_engine.bkg),transit,\
+		*ratio_terms(star_engine,planet_engine,n_background,transit)[:2])
+	numerator, denominator, centered = ratio_terms(star_engine,planet_engine,n_background,transit,dtype)
+	reduced = ratio_chunk(star_noise.astype(dtype),planet_noise.astype(dtype),transit,numerator,denominator)
+	error = np.sqrt(np.mean((reduced - exact)**2,axis=0))
+	sigma = exact.std(axis=0)
+	with np.errstate(divide='ignore',invalid='ignore'):
+		relative = np.where(error > 0,error/sigma,0.)
+	return float(np.nanmax(relative))
+
+def resolve_dtype(star_engine,planet_engine,n_background,transit,dtype,tolerance=FLOAT32_TOLERANCE):
+	"""
+	dtype when the precision check passes, float64 with a warning otherwise
+	"""
+	dtype = np.dtype(dtype)
+	if dtype == np.float64:
+		return dtype
+	if dtype != np.float32:
+		raise ValueError('dtype must be float32 or float64, got %s' % (dtype,))
+	error = check_precision(star_engine,planet_engine,n_background,transit,dtype)
+	if error > tolerance:
+		warnings.warn('%s ratio error is %.3g sigma, above the tolerance of %.3g sigma, '\
+			'falling back to float64' % (dtype,error,tolerance),RuntimeWarning,stacklevel=3)
+		return np.dtype(np.float64)
+	return dtype
+
+def simulate_ratio(star_engine,planet_engine,n_background,n_instance,transit,\
+	chunk_size=10000,percentiles=None,profiler=NULL_PROFILER,dtype=np.float64):
+	"""
+	draw n_instance star and planet realizations chunk by chunk and accumulate
+	the statistics of (star - planet)/(star - bkg) for transits or
+	(planet - star)/(star - bkg) for secondary eclipses,
+	only chunk_size realizations are held in memory at any time,
+	the sampling and statistics stages are timed by profiler
+	dtype: float64, or float32 to halve the memory of the realizations, the
+	       statistics are still accumulated in float64 and the float32 ratio
+	       is first checked against float64 (resolve_dtype)
+	return a RunningStatistics object
+	"""
+	dtype = resolve_dtype(star_engine,planet_engine,n_background,transit,dtype)
+	numerator, denominator, centered = ratio_terms(star_engine,planet_engine,n_background,transit,dtype)
+	stats = RunningStatistics(percentiles)
+	star_buffer = None
+	for start in range(0,n_instance,chunk_size):
+		n = min(chunk_size,n_instance-start)
+		if star_buffer is None or len(star_buffer) != n:
+			star_buffer = np.empty((n,)+star_engine.shape,dtype=dtype)
+			planet_buffer = np.empty((n,)+planet_engine.shape,dtype=dtype)
+		with profiler.stage('sampling') as stage:
+			star = star_engine.generate(n,out=star_buffer,centered=centered)
+			planet = planet_engine.generate(n,out=planet_buffer,centered=centered)
+			stage.output(star,planet)
+		with profiler.stage('statistics'):
+			stats.update(ratio_chunk(star,planet,transit,numerator,denominator))
+	return stats
+
+def simulate_ratio_adaptive(star_engine,planet_engine,n_background,transit,rtol,\
+	max_instance,chunk_size=10000,time_budget=None,min_instance=100,percentiles=None,profiler=NULL_PROFILER,\
+	dtype=np.float64):
+	"""
+	like simulate_ratio, but draw the realizations in batches and keep drawing
+	only the bins whose estimate has not converged, a bin converges once the
+	standard error of its sigma is below rtol*sigma and the standard error of
+	its mean below rtol*max(|mean|, sigma)
+	max_instance: sample budget per bin
+	chunk_size: largest batch, each batch is sized by the samples the slowest
+	            bin still needs, estimated from its current standard errors
+	time_budget: optional wall time limit in seconds, checked between batches
+	min_instance: samples drawn for every bin before convergence is tested
+	dtype: float64 or float32, see simulate_ratio
+	return a RunningStatistics object whose n counts the samples of every bin,
+	and a boolean array of the converged bins
+
+	the standard errors assume independent realizations, so the engines must
+	use random sampling: antithetic pairs and quasi random points are not
+	independent and their error is not estimated by the sample variance
+	"""
+	for engine in (star_engine,planet_engine):
+		if engine.sampling != 'random':
+			raise ValueError("adaptive sampling needs sampling='random', got %r" % (engine.sampling,))
+	start = time.perf_counter()
+	dtype = resolve_dtype(star_engine,planet_engine,n_background,transit,dtype)
+	numerator, denominator, centered = ratio_terms(star_engine,planet_engine,n_background,transit,dtype)
+	stats = RunningStatistics(percentiles,kurtosis=True)
+	index = None
+	n = min(max(min_instance,1),max_instance,chunk_size)
+	while True:
+		with profiler.stage('sampling') as stage:
+			star = star_engine.generate(n,dtype=dtype,index=index,centered=centered)
+			planet = planet_engine.generate(n,dtype=dtype,index=index,centered=centered)
+			stage.output(star,planet)
+		with profiler.stage('statistics'):
+			if index is None:
+				ratio = ratio_chunk(star,planet,transit,numerator,denominator)
+			else:
+				ratio = ratio_chunk(star,planet,transit,None if numerator is None else numerator[...,index],\
+					denominator[...,index])
+			stats.update(ratio,index)
+			n_done = np.broadcast_to(stats.n,stats.mean.shape)
+			sigma = stats.sigma
+			scale = rtol*np.maximum(np.abs(stats.mean),sigma)
+			# samples needed for the standard errors to reach the tolerance
+			needed = n_done*np.maximum((stats.standard_error/scale)**2,\
+				(stats.sigma_standard_error/(rtol*sigma))**2)
+			needed = np.where(np.isfinite(needed),needed,0.)
+			converged = (n_done >= min_instance) & (needed <= n_done)
+			active = ~converged & (n_done < max_instance)
+		if not np.any(active):
+			break
+		if time_budget is not None and time.perf_counter() - start > time_budget:
+			break
+		index = np.flatnonzero(active.reshape(-1,active.shape[-1]).any(axis=0))
+		remaining = max_instance - n_done[...,index].min()
+		n = int(min(max(np.max(needed[...,index] - n_done[...,index]),1),remaining,chunk_size))
+	return stats, converged
+
+def _resolve_cache(cache):
+	if cache is True:
+		return flux_cache.default_cache
+	if cache is False:
+		return None
+	return cache
 
 class TransitSpectra:
 	"""
@@ -18,8 +193,11 @@ class TransitSpectra:
 
 	def Compute(self,transit_file_path,d,\
 		A_tel,tau,R,noise_floor,binned_wavelength_min,binned_wavelength_max,\
-		n_ints,t,n_instance):
+		n_ints,t,n_instance,rng=None,chunk_size=10000,percentiles=None,mode='monte_carlo',\
+		cache=True,binning_mode='interpolate',profiler=None,star=None,rtol=1e-2,time_budget=None,sampling='random',\
+		dtype=np.float64,correlated=None):
 		"""
+		transit_file_path: transit spectra file or TransitData
 		d is the distance in parsec from the planetary system to telescope
 		R_p: planetary radius
 		tau: transmission efficiency
@@ -27,44 +205,153 @@ class TransitSpectra:
 		n_ints: number of integrations
 		t is the total integration time
 		number of instances for simulating noise
+		rng: seed or numpy Generator for the noise, fix it to reproduce the spectra,
+		     compared models run with the same seed share their random numbers
+		sampling: 'random', 'antithetic', 'sobol' or 'halton', see NoiseEngine
+		correlated: optional noise_engine.CovarianceNoise or PowerSpectrumNoise over
+		            the bins, the systematic noise of the star and planet signals
+		            is then correlated across wavelength (monte carlo and adaptive
+		            modes, the analytic sigma is unchanged)
+		dtype: float64, or float32 to halve the memory and bandwidth of the monte
+		       carlo realizations, float64 is used with a warning when the float32
+		       ratio fails the precision check of simulate_ratio
+		chunk_size: number of realizations held in memory at once
+		percentiles: optional list of percentiles (0-100) to estimate, e.g. [16,84]
+		mode: 'monte_carlo' samples n_instance realizations,
+		      'analytic' propagates the gaussian noise with the delta method instead,
+		      'adaptive' samples each bin until mean and sigma are known to rtol,
+		      at most n_instance times or for time_budget seconds, and stores the
+		      samples used per bin in n_instance and the converged bins in converged,
+		      it needs random sampling
+		cache: True to reuse the binned flux of flux_cache.default_cache,
+		       False to recompute it, or an flux_cache.LRUCache
+		binning_mode: 'interpolate' samples the spectra at the bin centers,
+		              'average' conserves the flux within each bin
+		profiler: optional profiling.StageProfiler, its report is stored in self.profile
+		star: Star of the host, a solar blackbody by default
 		return the spectra
 		"""
-		# read transit data
-		transit_data = TransitData()
-		transit_data.Read(transit_file_path)
-		# star luminosity per wavelength
-		star = Star()
-		L_star = star.BlackBodySpectra(transit_data.wavelength)
-		# construct transit flux object
-		transit_flux = TransitFlux(transit_data,d,L_star)
+		profiler = profiler or NULL_PROFILER
+		# binned star and in transit luminosity, read and binned only on a cache miss
+		with profiler.stage('binned_flux') as stage:
+			star = star or Star()
+			binned_wavelength, L_star_bin, L_in_transit_bin = flux_cache.binned_luminosity('transit',transit_file_path,star,\
+				binned_wavelength_min,binned_wavelength_max,R,_resolve_cache(cache),binning_mode,profiler)
+			stage.output(L_star_bin,L_in_transit_bin)
 		# construct spectra object
-		source_obj = BinnedTransitPhotonNumber(binned_wavelength_min,binned_wavelength_max,transit_flux,R,tau,A_tel,t)
-		bkg_obj = BinnedJWSTBackgroundPhotonEnergy(source_obj.binned_wavelength,R,t)
-		detector_noise = DetectorNoise(source_obj.binned_wavelength,R,n_ints)
-		sys_noise = SysNoise(source_obj.binned_wavelength,noise_floor)
+		with profiler.stage('photon_number') as stage:
+			dilution = flux_dilution(d)
+			source_obj = BinnedTransitPhotonNumber(binned_wavelength_min,binned_wavelength_max,None,R,tau,A_tel,t,\
+				binned_flux=(binned_wavelength,L_star_bin*dilution,L_in_transit_bin*dilution))
+			stage.output(source_obj.n_star_bin,source_obj.n_in_transit_bin)
+		with profiler.stage('background') as stage:
+			bkg_obj = BinnedJWSTBackgroundPhotonEnergy(source_obj.binned_wavelength,R,t)
+			stage.output(bkg_obj.n_background)
+		with profiler.stage('detector_noise') as stage:
+			detector_noise = DetectorNoise(source_obj.binned_wavelength,R,n_ints)
+			stage.output(detector_noise.sigma)
+		with profiler.stage('systematic_noise') as stage:
+			sys_noise = SysNoise(source_obj.binned_wavelength,noise_floor)
+			stage.output(sys_noise.ratio)
 
-		# generate n noisy star signal
-		star_noise_engine = NoiseEngine(source_obj.n_star_bin,bkg_obj.n_background,detector_noise,sys_noise)
-		noisy_star_signals = star_noise_engine.generate(n_instance)
+		# star and planet signals share one random stream
+		rng = np.random.default_rng(rng)
 
-		# generate n noisy in transit signal
-		in_transit_noise_engine = NoiseEngine(source_obj.n_in_transit_bin,bkg_obj.n_background,detector_noise,sys_noise)
-		noisy_in_transit_signals = in_transit_noise_engine.generate(n_instance)
+		# noisy star and in transit signals
+		star_noise_engine = NoiseEngine(source_obj.n_star_bin,bkg_obj.n_background,detector_noise,sys_noise,rng,correlated,\
+			sampling=sampling)
+		in_transit_noise_engine = NoiseEngine(source_obj.n_in_transit_bin,bkg_obj.n_background,detector_noise,sys_noise,rng,correlated,\
+			sampling=sampling,qmc_shared=star_noise_engine)
 
 		# compute the spectra
-		depth = []
-		depth_squared = []
-		for i in range(n_instance):
-			depth_instance = (noisy_star_signals[i] - noisy_in_transit_signals[i])/(noisy_star_signals[i]-bkg_obj.n_background)
-			depth.append(depth_instance)
-			depth_squared.append(depth_instance*depth_instance)
-		self.mean_depth = sum(depth)/len(depth)
-		self.sigma = np.sqrt(sum(depth_squared)/len(depth) - self.mean_depth*self.mean_depth)
+		self.n_instance = n_instance
+		self.percentiles = None
+		if mode == 'analytic':
+			with profiler.stage('analytic'):
+				self.mean_depth, self.sigma = ratio_moments(star_noise_engine.source,in_transit_noise_engine.source,\
+					star_noise_engine.sigma_total,in_transit_noise_engine.sigma_total,True)
+				if percentiles is not None:
+					self.percentiles = dict((q,self.mean_depth + self.sigma*ndtri(q/100.)) for q in percentiles)
+		elif mode == 'monte_carlo':
+			with profiler.stage('monte_carlo'):
+				stats = simulate_ratio(star_noise_engine,in_transit_noise_engine,bkg_obj.n_background,\
+					n_instance,True,chunk_size,percentiles,profiler,dtype)
+				self.mean_depth = stats.mean
+				self.sigma = stats.sigma
+				if percentiles is not None:
+					self.percentiles = dict((q,stats.percentile(q)) for q in percentiles)
+		elif mode == 'adaptive':
+			with profiler.stage('adaptive'):
+				stats, self.converged = simulate_ratio_adaptive(star_noise_engine,in_transit_noise_engine,bkg_obj.n_background,\
+					True,rtol,n_instance,chunk_size,time_budget,percentiles=percentiles,profiler=profiler,dtype=dtype)
+				self.n_instance = stats.n
+				self.mean_depth = stats.mean
+				self.sigma = stats.sigma
+				if percentiles is not None:
+					self.percentiles = dict((q,stats.percentile(q)) for q in percentiles)
+		else:
+			raise ValueError("mode must be 'monte_carlo', 'analytic' or 'adaptive'")
 		self.binned_wavelength = source_obj.binned_wavelength
+		self.profile = profiler.report
 
 	def Plot(self,ax,**kwargs):
-		ax.errorbar(self.binned_wavelength,self.mean_depth,self.sigma,**kwargs)
-		return ax
+		return plotting.plot_spectra(ax,self.binned_wavelength,self.mean_depth,self.sigma,**kwargs)
+
+class TransitSpectraBatch:
+	"""
+	compute the transit spectra of many models sharing one wavelength grid,
+	the star, background, detector and systematic noise are computed once
+	"""
+	def __init__(self,binned_wavelength = None, depth = None):
+		self.binned_wavelength=binned_wavelength
+		self.mean_depth = depth
+
+	def Compute(self,wavelength,depths,d,\
+		A_tel,tau,R,noise_floor,binned_wavelength_min,binned_wavelength_max,\
+		n_ints,t,n_instance,rng=None,chunk_size=1000,mode='monte_carlo',binning_mode='interpolate',star=None,\
+		sampling='random',dtype=np.float64,correlated=None):
+		"""
+		wavelength: wavelength grid in micron shared by the models
+		depths: transit depth of each model, array of shape (n_models, n_wavelength)
+		the other parameters are the same as TransitSpectra.Compute,
+		chunk_size realizations of every model are held in memory at once
+		mean_depth and sigma are stored as arrays of shape (n_models, n_bins)
+		"""
+		depths = np.atleast_2d(depths)
+		star = star or Star()
+		L_star = star.Spectra(wavelength)
+		# all models are binned with one sparse matrix product
+		binning_obj = Binning(wavelength,binned_wavelength_min,binned_wavelength_max,R,binning_mode)
+		L_star_bin = binning_obj.binning(L_star)
+		L_in_transit_bin = binning_obj.binning(L_star*(1-depths))
+		dilution = flux_dilution(d)
+		source_obj = BinnedTransitPhotonNumber(binned_wavelength_min,binned_wavelength_max,None,R,tau,A_tel,t,\
+			binned_flux=(binning_obj.binned_wavelength,L_star_bin*dilution,L_in_transit_bin*dilution))
+		bkg_obj = BinnedJWSTBackgroundPhotonEnergy(source_obj.binned_wavelength,R,t)
+		detector_noise = DetectorNoise(source_obj.binned_wavelength,R,n_ints)
+		sys_noise = SysNoise(source_obj.binned_wavelength,noise_floor)
+
+		self.n_instance = n_instance
+		if mode == 'analytic':
+			star_noise_engine = NoiseEngine(source_obj.n_star_bin,bkg_obj.n_background,detector_noise,sys_noise)
+			in_transit_noise_engine = NoiseEngine(source_obj.n_in_transit_bin,bkg_obj.n_background,detector_noise,sys_noise)
+			self.mean_depth, self.sigma = ratio_moments(star_noise_engine.source,in_transit_noise_engine.source,\
+				star_noise_engine.sigma_total,in_transit_noise_engine.sigma_total,True)
+		elif mode == 'monte_carlo':
+			rng = np.random.default_rng(rng)
+			# every model gets its own star realizations, as in TransitSpectra
+			n_star_bin = np.broadcast_to(source_obj.n_star_bin,source_obj.n_in_transit_bin.shape)
+			star_noise_engine = NoiseEngine(n_star_bin,bkg_obj.n_background,detector_noise,sys_noise,rng,correlated,\
+				sampling=sampling)
+			in_transit_noise_engine = NoiseEngine(source_obj.n_in_transit_bin,bkg_obj.n_background,detector_noise,sys_noise,rng,correlated,\
+				sampling=sampling,qmc_shared=star_noise_engine)
+			stats = simulate_ratio(star_noise_engine,in_transit_noise_engine,bkg_obj.n_background,\
+				n_instance,True,chunk_size,dtype=dtype)
+			self.mean_depth = stats.mean
+			self.sigma = stats.sigma
+		else:
+			raise ValueError("mode must be 'monte_carlo' or 'analytic'")
+		self.binned_wavelength = source_obj.binned_wavelength
 
 class SecondarySpectra:
 	"""
@@ -76,8 +363,11 @@ class SecondarySpectra:
 
 	def Compute(self,emergent_file_path,d,R_p,\
 		A_tel,tau,R,noise_floor,binned_wavelength_min,binned_wavelength_max,\
-		n_ints,t,n_instance):
+		n_ints,t,n_instance,rng=None,chunk_size=10000,percentiles=None,mode='monte_carlo',\
+		cache=True,binning_mode='interpolate',profiler=None,star=None,rtol=1e-2,time_budget=None,sampling='random',\
+		dtype=np.float64,correlated=None):
 		"""
+		emergent_file_path: emergent spectra file or EmergentData
 		d is the distance in parsec from the planetary system to telescope
 		R_p: planetary radius
 		tau: transmission efficiency
@@ -85,44 +375,117 @@ class SecondarySpectra:
 		n_ints: number of integrations
 		t is the total integration time
 		number of instances for simulating noise
+		rng: seed or numpy Generator for the noise, fix it to reproduce the spectra,
+		     compared models run with the same seed share their random numbers
+		sampling: 'random', 'antithetic', 'sobol' or 'halton', see NoiseEngine
+		correlated: optional noise_engine.CovarianceNoise or PowerSpectrumNoise over
+		            the bins, the systematic noise of the star and planet signals
+		            is then correlated across wavelength (monte carlo and adaptive
+		            modes, the analytic sigma is unchanged)
+		dtype: float64, or float32 to halve the memory and bandwidth of the monte
+		       carlo realizations, float64 is used with a warning when the float32
+		       ratio fails the precision check of simulate_ratio
+		chunk_size: number of realizations held in memory at once
+		percentiles: optional list of percentiles (0-100) to estimate, e.g. [16,84]
+		mode: 'monte_carlo' samples n_instance realizations,
+		      'analytic' propagates the gaussian noise with the delta method instead,
+		      'adaptive' samples each bin until mean and sigma are known to rtol,
+		      at most n_instance times or for time_budget seconds, and stores the
+		      samples used per bin in n_instance and the converged bins in converged,
+		      it needs random sampling
+		cache: True to reuse the binned flux of flux_cache.default_cache,
+		       False to recompute it, or an flux_cache.LRUCache
+		binning_mode: 'interpolate' samples the spectra at the bin centers,
+		              'average' conserves the flux within each bin
+		profiler: optional profiling.StageProfiler, its report is stored in self.profile
+		star: Star of the host, a solar blackbody by default
 		return the spectra
 		"""
-		# read transit data
-		emergent_data = EmergentData()
-		emergent_data.Read(emergent_file_path)
-		# star luminosity per wavelength
-		star = Star()
-		L_star = star.BlackBodySpectra(emergent_data.wavelength)
-		# construct transit flux object
-		secondary_flux = SecondaryFlux(emergent_data,d,R_p,L_star)
+		profiler = profiler or NULL_PROFILER
+		# binned star luminosity and planetary flux, read and binned only on a cache miss
+		with profiler.stage('binned_flux') as stage:
+			star = star or Star()
+			binned_wavelength, L_star_bin, f_planet_bin = flux_cache.binned_luminosity('secondary',emergent_file_path,star,\
+				binned_wavelength_min,binned_wavelength_max,R,_resolve_cache(cache),binning_mode,profiler)
+			stage.output(L_star_bin,f_planet_bin)
 		# construct spectra object
-		source_obj = BinnedSecondaryPhotonNumber(binned_wavelength_min,binned_wavelength_max,secondary_flux,R,tau,A_tel,t)
-		bkg_obj = BinnedJWSTBackgroundPhotonEnergy(source_obj.binned_wavelength,R,t)
-		detector_noise = DetectorNoise(source_obj.binned_wavelength,R,n_ints)
-		sys_noise = SysNoise(source_obj.binned_wavelength,noise_floor)
+		with profiler.stage('photon_number') as stage:
+			dilution = flux_dilution(d)
+			L_out_transit_bin = f_planet_bin*(4*np.pi*R_p*R_p) + L_star_bin
+			source_obj = BinnedSecondaryPhotonNumber(binned_wavelength_min,binned_wavelength_max,None,R,tau,A_tel,t,\
+				binned_flux=(binned_wavelength,L_star_bin*dilution,L_out_transit_bin*dilution))
+			stage.output(source_obj.n_star_bin,source_obj.n_out_transit_bin)
+		with profiler.stage('background') as stage:
+			bkg_obj = BinnedJWSTBackgroundPhotonEnergy(source_obj.binned_wavelength,R,t)
+			stage.output(bkg_obj.n_background)
+		with profiler.stage('detector_noise') as stage:
+			detector_noise = DetectorNoise(source_obj.binned_wavelength,R,n_ints)
+			stage.output(detector_noise.sigma)
+		with profiler.stage('systematic_noise') as stage:
+			sys_noise = SysNoise(source_obj.binned_wavelength,noise_floor)
+			stage.output(sys_noise.ratio)
 
-		# generate n noisy star signal
-		star_noise_engine = NoiseEngine(source_obj.n_star_bin,bkg_obj.n_background,detector_noise,sys_noise)
-		noisy_star_signals = star_noise_engine.generate(n_instance)
+		# star and planet signals share one random stream
+		rng = np.random.default_rng(rng)
 
-		# generate n noisy in transit signal
-		out_transit_noise_engine = NoiseEngine(source_obj.n_out_transit_bin,bkg_obj.n_background,detector_noise,sys_noise)
-		noisy_out_transit_signals = out_transit_noise_engine.generate(n_instance)
+		# noisy star and out of transit signals
+		star_noise_engine = NoiseEngine(source_obj.n_star_bin,bkg_obj.n_background,detector_noise,sys_noise,rng,correlated,\
+			sampling=sampling)
+		out_transit_noise_engine = NoiseEngine(source_obj.n_out_transit_bin,bkg_obj.n_background,detector_noise,sys_noise,rng,correlated,\
+			sampling=sampling,qmc_shared=star_noise_engine)
 
 		# compute the spectra
-		ratio = []
-		ratio_squared = []
-		for i in range(n_instance):
-			ratio_instance = (noisy_out_transit_signals[i] - noisy_star_signals[i])/(noisy_star_signals[i]-bkg_obj.n_background)
-			ratio.append(ratio_instance)
-			ratio_squared.append(ratio_instance*ratio_instance)
-		self.mean_ratio = sum(ratio)/len(ratio)
-		self.sigma = np.sqrt(sum(ratio_squared)/len(ratio) - self.mean_ratio*self.mean_ratio)
+		self.n_instance = n_instance
+		self.percentiles = None
+		if mode == 'analytic':
+			with profiler.stage('analytic'):
+				self.mean_ratio, self.sigma = ratio_moments(star_noise_engine.source,out_transit_noise_engine.source,\
+					star_noise_engine.sigma_total,out_transit_noise_engine.sigma_total,False)
+				if percentiles is not None:
+					self.percentiles = dict((q,self.mean_ratio + self.sigma*ndtri(q/100.)) for q in percentiles)
+		elif mode == 'monte_carlo':
+			with profiler.stage('monte_carlo'):
+				stats = simulate_ratio(star_noise_engine,out_transit_noise_engine,bkg_obj.n_background,\
+					n_instance,False,chunk_size,percentiles,profiler,dtype)
+				self.mean_ratio = stats.mean
+				self.sigma = stats.sigma
+				if percentiles is not None:
+					self.percentiles = dict((q,stats.percentile(q)) for q in percentiles)
+		elif mode == 'adaptive':
+			with profiler.stage('adaptive'):
+				stats, self.converged = simulate_ratio_adaptive(star_noise_engine,out_transit_noise_engine,bkg_obj.n_background,\
+					False,rtol,n_instance,chunk_size,time_budget,percentiles=percentiles,profiler=profiler,dtype=dtype)
+				self.n_instance = stats.n
+				self.mean_ratio = stats.mean
+				self.sigma = stats.sigma
+				if percentiles is not None:
+					self.percentiles = dict((q,stats.percentile(q)) for q in percentiles)
+		else:
+			raise ValueError("mode must be 'monte_carlo', 'analytic' or 'adaptive'")
 		self.binned_wavelength = source_obj.binned_wavelength
+		self.profile = profiler.report
 
 	def Plot(self,ax,**kwargs):
-		ax.errorbar(self.binned_wavelength,self.mean_ratio,self.sigma,**kwargs)
-		return ax
-
-
+		return plotting.plot_spectra(ax,self.binned_wavelength,self.mean_ratio,self.sigma,**kwargs)
 
+def compare_analytic(spectra_class,*args,**kwargs):
+	"""
+	run spectra_class().Compute with the same arguments in the analytic and
+	monte carlo modes and report how far the analytic spectra deviates
+	return a dict with per bin arrays
+	mean_z: analytic - monte carlo mean in units of the monte carlo standard error
+	sigma_error: relative error of the analytic sigma
+	and their maximum absolute values max_mean_z and max_sigma_error
+	"""
+	monte_carlo = spectra_class()
+	monte_carlo.Compute(*args,mode='monte_carlo',**kwargs)
+	analytic = spectra_class()
+	analytic.Compute(*args,mode='analytic',**kwargs)
+	if isinstance(monte_carlo,TransitSpectra):
+		mean_mc, mean_an = monte_carlo.mean_depth, analytic.mean_depth
+	else:
+		mean_mc, mean_an = monte_carlo.mean_ratio, analytic.mean_ratio
+	mean_z = (mean_an - mean_mc)/(monte_carlo.sigma/np.sqrt(monte_carlo.n_instance))
+	sigma_error = analytic.sigma/monte_carlo.sigma - 1.
+	return {'mean_z':mean_z,'sigma_error':sigma_error,\
+		'max_mean_z':np.max(np.abs(mean_z)),'max_sigma_error':np.max(np.abs(sigma_error))}
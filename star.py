@@ -1,43 +1,130 @@
 """
 This module computes the property of the star alone
 """
+import collections
+import hashlib
 import numpy as np 
+from stellar_grid import StellarGrid
+
+_factor_cache = collections.OrderedDict()
+_factor_cache_size = 32
 
 class Star:
-	def __init__(self,T=None,R=None):
+	def __init__(self,T=None,R=None,logg=None,metallicity=None,grid=None,method='trilinear'):
 		# define the planet by temperature and radius
 		# default to be solar-like star
-		if T == None:
+		if T is None:
 			self.T = 5750
 		else:
 			self.T = T 
-		if R == None:
+		if R is None:
 			self.R = 6.955e8
 		else:
 			self.R = R
+		# surface gravity log10(g/cgs) and [Fe/H], only used with a stellar grid
+		if logg is None:
+			self.logg = 4.44
+		else:
+			self.logg = logg
+		if metallicity is None:
+			self.metallicity = 0.
+		else:
+			self.metallicity = metallicity
+		# stellar_grid.StellarGrid or the directory of one, None for a blackbody
+		self.grid = grid
+		# 'trilinear' or 'nearest' interpolation of the grid
+		self.method = method
 
 	def StarSpectra(self,wavelength,file_path=None):
 		"""
 		input: wavelength grid in micron
-		input: path to the file containing the spectra
-		return the luminosity per wavelength
+		input: path to the directory of a stellar_grid.StellarGrid, self.grid by default
+		return the luminosity per wavelength (W/m) interpolated from the grid
+		"""
+		grid = file_path if file_path is not None else self.grid
+		if grid is None:
+			raise ValueError('no stellar grid given')
+		if not isinstance(grid,StellarGrid):
+			grid = StellarGrid.load(grid)
+		return grid.luminosity(wavelength,self.T,self.R,self.logg,self.metallicity,self.method)
+
+	def Spectra(self,wavelength):
+		"""
+		luminosity per wavelength (W/m) from the stellar grid when one is
+		set, otherwise the blackbody
 		"""
-		pass
+		if self.grid is None:
+			return self.BlackBodySpectra(wavelength)
+		return self.StarSpectra(wavelength)
+
+	def key(self):
+		"""
+		tuple identifying the spectra of the star, for caches
+		"""
+		if self.grid is None:
+			return (parameter_key(self.T),parameter_key(self.R))
+		grid = self.grid if isinstance(self.grid,StellarGrid) else StellarGrid.load(self.grid)
+		return (parameter_key(self.T),parameter_key(self.R),parameter_key(self.logg),\
+			parameter_key(self.metallicity),grid.key,self.method)
 
 	def BlackBodySpectra(self,wavelength):
 		"""
 		input: wavelength is a vector in micron
 		compute blackbody radiation and
 		return the luminosity per wavelength (W/m)
+		T and R may be arrays of many stars, the result then has the shape
+		broadcast(T, R).shape + (n_wavelength,)
 		"""
-		h = 6.626e-34
-		c = 3e+8
-		k = 1.38e-23
-		# convert from micron to meters
-		wavelength = wavelength*1.e-6
-		flux_bd = 2*np.pi*h*c*c/(wavelength**5)/(np.exp(h*c/(wavelength*k*self.T))-1.)
-		L_bd = flux_bd*4*np.pi*self.R*self.R
-		return L_bd
+		return blackbody_luminosity(wavelength,self.T,self.R)
+
+def parameter_key(value):
+	"""
+	hashable key of a stellar parameter: the float of a scalar, the shape and
+	the sha1 of the float64 values of an array of many stars
+	"""
+	value = np.asarray(value,dtype=float)
+	if value.ndim == 0:
+		return float(value)
+	return (value.shape,hashlib.sha1(np.ascontiguousarray(value)).hexdigest())
+
+def blackbody_factors(wavelength):
+	"""
+	wavelength only factors 2*pi*h*c^2/wavelength^5 and h*c/(wavelength*k)
+	of the blackbody, cached per wavelength grid
+	"""
+	wavelength = np.asarray(wavelength,dtype=float)
+	key = (wavelength.shape,hashlib.sha1(np.ascontiguousarray(wavelength)).hexdigest())
+	if key in _factor_cache:
+		_factor_cache.move_to_end(key)
+		return _factor_cache[key]
+	h = 6.626e-34
+	c = 3e+8
+	k = 1.38e-23
+	# convert from micron to meters
+	wavelength = wavelength*1.e-6
+	factors = 2*np.pi*h*c*c/(wavelength**5), h*c/(wavelength*k)
+	for factor in factors:
+		factor.setflags(write=False)
+	_factor_cache[key] = factors
+	while len(_factor_cache) > _factor_cache_size:
+		_factor_cache.popitem(last=False)
+	return factors
+
+def blackbody_luminosity(wavelength,T,R):
+	"""
+	wavelength: grid in micron
+	T, R: temperature (K) and radius (m), scalars or arrays of many stars
+	return the luminosity per wavelength (W/m) of shape
+	broadcast(T, R).shape + (n_wavelength,) in one pass, expm1 keeps the
+	long wavelength tail accurate
+	"""
+	prefactor, exponent = blackbody_factors(wavelength)
+	# trailing wavelength axis for every star
+	T = np.reshape(np.asarray(T,dtype=float),np.shape(T)+(1,))
+	R = np.reshape(np.asarray(R,dtype=float),np.shape(R)+(1,))
+	# expm1 overflows to inf far on the Wien side, where the luminosity is 0
+	with np.errstate(over='ignore'):
+		return prefactor/np.expm1(exponent/T)*(4*np.pi*R*R)
 
 if __name__ == "__main__":
 	# wavelegnth in microns
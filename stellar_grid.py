@@ -0,0 +1,163 @@
+"""
+tabulated stellar model spectra on a regular Teff/logg/[Fe/H] grid
+
+the grid is kept in a directory holding axes.npz (T, logg, metallicity and
+wavelength axes) and flux.npy (surface flux per wavelength in W/m^2/m of
+shape (n_T, n_logg, n_metallicity, n_wavelength)), which is memory mapped
+so that only the models around the requested stars are read
+"""
+import collections
+import hashlib
+import itertools
+import os
+import numpy as np
+from read_data import read_columns
+
+# (signature of flux.npy, grid) loaded from each directory
+_grids = {}
+
+class StellarGrid:
+	"""
+	nearest neighbour or trilinear interpolation of the model spectra, the
+	luminosity on a wavelength grid is cached per star and wavelength grid
+	"""
+	def __init__(self,T,logg,metallicity,wavelength,flux,cache_size=32):
+		"""
+		T, logg, metallicity: increasing grid axes
+		wavelength: increasing model wavelength in micron
+		flux: (n_T, n_logg, n_metallicity, n_wavelength) surface flux per wavelength (W/m^2/m)
+		"""
+		self.axes = tuple(np.asarray(axis,dtype=float) for axis in (T,logg,metallicity))
+		self.wavelength = np.asarray(wavelength,dtype=float)
+		self.flux = flux
+		if flux.shape != tuple(axis.size for axis in self.axes) + (self.wavelength.size,):
+			raise ValueError('flux shape %s does not match the grid axes' % (flux.shape,))
+		for axis in self.axes + (self.wavelength,):
+			if np.any(np.diff(axis) <= 0):
+				raise ValueError('grid axes must be strictly increasing')
+		# content hash of the whole grid, read one temperature at a time
+		sha1 = hashlib.sha1()
+		for axis in self.axes + (self.wavelength,):
+			sha1.update(np.ascontiguousarray(axis))
+		for flux_T in flux:
+			sha1.update(np.ascontiguousarray(flux_T,dtype=np.float64))
+		self.key = sha1.hexdigest()
+		self.cache_size = cache_size
+		self._cache = collections.OrderedDict()
+
+	@classmethod
+	def load(cls,directory):
+		"""
+		open the grid written by save or from_models, the flux is memory
+		mapped and the grid is only loaded again when flux.npy changed
+		"""
+		directory = os.path.abspath(directory)
+		stat = os.stat(os.path.join(directory,'flux.npy'))
+		signature = (stat.st_mtime_ns,stat.st_size)
+		if directory not in _grids or _grids[directory][0] != signature:
+			with np.load(os.path.join(directory,'axes.npz')) as axes:
+				T, logg, metallicity, wavelength = axes['T'], axes['logg'], axes['metallicity'], axes['wavelength']
+			flux = np.load(os.path.join(directory,'flux.npy'),mmap_mode='r')
+			_grids[directory] = (signature,cls(T,logg,metallicity,wavelength,flux))
+		return _grids[directory][1]
+
+	def save(self,directory):
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		np.savez(os.path.join(directory,'axes.npz'),T=self.axes[0],logg=self.axes[1],\
+			metallicity=self.axes[2],wavelength=self.wavelength)
+		np.save(os.path.join(directory,'flux.npy'),self.flux)
+		_grids.pop(os.path.abspath(directory),None)
+
+	@classmethod
+	def from_models(cls,models,directory):
+		"""
+		models: iterable of (T, logg, metallicity, file_path), one two column
+		        (wavelength in micron, surface flux in W/m^2/m) file for every
+		        point of the grid
+		every model is interpolated on the wavelength of the first one and
+		written to directory one at a time
+		return the loaded grid
+		"""
+		models = list(models)
+		axes = [np.unique([model[i] for model in models]) for i in range(3)]
+		shape = tuple(axis.size for axis in axes)
+		if len(models) != np.prod(shape):
+			raise ValueError('models do not cover the full %s grid' % ('x'.join(map(str,shape)),))
+		wavelength = np.sort(read_columns(models[0][3])[0])
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		flux = np.lib.format.open_memmap(os.path.join(directory,'flux.npy'),mode='w+',\
+			dtype=np.float64,shape=shape + (wavelength.size,))
+		for T,logg,metallicity,file_path in models:
+			model_wavelength, model_flux = read_columns(file_path)
+			order = np.argsort(model_wavelength)
+			index = tuple(int(np.searchsorted(axis,value)) for axis,value in zip(axes,(T,logg,metallicity)))
+			flux[index] = np.interp(wavelength,model_wavelength[order],model_flux[order])
+		flux.flush()
+		del flux
+		np.savez(os.path.join(directory,'axes.npz'),T=axes[0],logg=axes[1],metallicity=axes[2],wavelength=wavelength)
+		_grids.pop(os.path.abspath(directory),None)
+		return cls.load(directory)
+
+	def _corners(self,values,method):
+		"""
+		values: (T, logg, metallicity) arrays of the same shape
+		return per axis list of (index, weight) pairs of the grid points
+		"""
+		corners = []
+		for axis,value,name in zip(self.axes,values,('T','logg','metallicity')):
+			if np.any(value < axis[0]) or np.any(value > axis[-1]):
+				raise ValueError('%s outside the stellar grid range [%g, %g]' % (name,axis[0],axis[-1]))
+			if axis.size == 1:
+				corners.append([(np.zeros(value.shape,dtype=int),np.ones(value.shape))])
+				continue
+			i = np.clip(np.searchsorted(axis,value,side='right')-1,0,axis.size-2)
+			w = (value - axis[i])/(axis[i+1] - axis[i])
+			if method == 'nearest':
+				corners.append([(np.where(w < 0.5,i,i+1),np.ones(value.shape))])
+			elif method == 'trilinear':
+				corners.append([(i,1-w),(i+1,w)])
+			else:
+				raise ValueError("method must be 'nearest' or 'trilinear'")
+		return corners
+
+	def surface_flux(self,T,logg,metallicity,method='trilinear'):
+		"""
+		T, logg, metallicity: scalars or arrays broadcast against each other
+		return the surface flux per wavelength (W/m^2/m) on self.wavelength,
+		of shape broadcast shape + (n_wavelength,)
+		"""
+		values = np.broadcast_arrays(*[np.asarray(value,dtype=float) for value in (T,logg,metallicity)])
+		corners = self._corners(values,method)
+		flux = np.zeros(values[0].shape + self.wavelength.shape)
+		for (i,wi),(j,wj),(k,wk) in itertools.product(*corners):
+			flux += (wi*wj*wk)[...,None]*self.flux[i,j,k]
+		return flux
+
+	def luminosity(self,wavelength,T,R,logg,metallicity,method='trilinear'):
+		"""
+		wavelength: grid in micron inside the model wavelength range
+		R: stellar radius in m, broadcast against T, logg and metallicity
+		return the luminosity per wavelength (W/m) of shape broadcast shape + (n_wavelength,)
+		"""
+		wavelength = np.asarray(wavelength,dtype=float)
+		stars = np.broadcast_arrays(*[np.asarray(value,dtype=float) for value in (T,R,logg,metallicity)])
+		key = (method,hashlib.sha1(np.ascontiguousarray(wavelength)).hexdigest(),wavelength.shape,\
+			hashlib.sha1(np.ascontiguousarray(stars)).hexdigest(),stars[0].shape)
+		if key in self._cache:
+			self._cache.move_to_end(key)
+			return self._cache[key]
+		T, R, logg, metallicity = stars
+		if np.any(wavelength < self.wavelength[0]) or np.any(wavelength > self.wavelength[-1]):
+			raise ValueError('wavelength is outside the range of the stellar grid')
+		# linear interpolation in wavelength, the same for every star
+		j = np.clip(np.searchsorted(self.wavelength,wavelength,side='right')-1,0,self.wavelength.size-2)
+		w = (wavelength - self.wavelength[j])/(self.wavelength[j+1] - self.wavelength[j])
+		flux = self.surface_flux(T,logg,metallicity,method)
+		L = (flux[...,j]*(1-w) + flux[...,j+1]*w)*(4*np.pi*R*R)[...,None]
+		L.setflags(write=False)
+		self._cache[key] = L
+		while len(self._cache) > self.cache_size:
+			self._cache.popitem(last=False)
+		return L
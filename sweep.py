@@ -0,0 +1,129 @@
+"""
+evaluate the transit spectra over arrays or grids of observing parameters
+"""
+import numpy as np 
+from star import Star
+from source_flux import flux_dilution
+from binned_photon_energy import BinnedTransitPhotonNumber, BinnedJWSTBackgroundPhotonEnergy
+from detector_noise import DetectorNoise
+from sys_noise import SysNoise
+from noise_engine import NoiseEngine
+from error_propagation import ratio_moments
+from spectra import simulate_ratio, _resolve_cache
+import flux_cache
+
+class TransitSweep:
+	"""
+	compute the transit spectra for many combinations of d, A_tel, tau, R, n_ints
+	and t, the results are stored as arrays labeled by dims and coords
+	"""
+	dims = ('d','A_tel','tau','R','n_ints','t')
+
+	def Compute(self,transit_file_path,d,\
+		A_tel,tau,R,noise_floor,binned_wavelength_min,binned_wavelength_max,\
+		n_ints,t,grid=True,mode='analytic',n_instance=1000,rng=None,chunk_size=1000,cache=True,\
+		binning_mode='interpolate',correlated=None,point_chunk_size=64):
+		"""
+		d, A_tel, tau, R, n_ints, t: scalars or arrays
+		grid: if True evaluate the cartesian product of the parameters and the
+		      results have one axis per parameter in the order of dims,
+		      otherwise the parameters are broadcast against each other
+		mode: 'analytic' or 'monte_carlo', see TransitSpectra.Compute
+		n_instance, rng, chunk_size: only used in monte carlo mode
+		point_chunk_size: grid points simulated at once in monte carlo mode, each
+		                  realization buffer holds chunk_size*point_chunk_size*n_bins values
+		cache, binning_mode, correlated: see TransitSpectra.Compute
+
+		the results are stored in
+		binned_wavelength, mean_depth, sigma: arrays of shape (parameter shape) + (n_bins,),
+		    grid points with a coarser R have fewer bins and are padded with nan
+		n_bins: number of valid bins of each grid point
+		coords: dict of the parameter values, 1d per dim when grid is True,
+		        broadcast to the parameter shape otherwise
+		"""
+		params = [np.atleast_1d(np.asarray(p,dtype=float)) for p in (d,A_tel,tau,R,n_ints,t)]
+		if grid:
+			for p in params:
+				if p.ndim != 1:
+					raise ValueError('grid parameters must be scalars or 1d arrays')
+			self.coords = dict(zip(self.dims,params))
+			params = np.meshgrid(*params,indexing='ij')
+		else:
+			params = np.broadcast_arrays(*params)
+			self.coords = dict(zip(self.dims,params))
+		shape = params[0].shape
+		d, A_tel, tau, R, n_ints, t = [p.ravel() for p in params]
+
+		star = Star()
+		cache = _resolve_cache(cache)
+		rng = np.random.default_rng(rng)
+
+		# the binning only depends on R, group the grid points by R to reuse the binned flux
+		R_values, R_index = np.unique(R,return_inverse=True)
+		groups = []
+		for i,R_value in enumerate(R_values):
+			index = np.nonzero(R_index == i)[0]
+			groups.append((index,R_value) + self._group(index,R_value,transit_file_path,star,cache,binning_mode,\
+				d,A_tel,tau,n_ints,t,noise_floor,binned_wavelength_min,binned_wavelength_max,\
+				mode,n_instance,rng,chunk_size,correlated,point_chunk_size))
+
+		n_bins_max = max(group[2].size for group in groups)
+		self.binned_wavelength = np.full((d.size,n_bins_max),np.nan)
+		self.mean_depth = np.full((d.size,n_bins_max),np.nan)
+		self.sigma = np.full((d.size,n_bins_max),np.nan)
+		self.n_bins = np.zeros(d.size,dtype=int)
+		for index,R_value,binned_wavelength,mean_depth,sigma in groups:
+			n_bins = binned_wavelength.size
+			self.binned_wavelength[index,:n_bins] = binned_wavelength
+			self.mean_depth[index,:n_bins] = mean_depth
+			self.sigma[index,:n_bins] = sigma
+			self.n_bins[index] = n_bins
+		self.binned_wavelength = self.binned_wavelength.reshape(shape+(n_bins_max,))
+		self.mean_depth = self.mean_depth.reshape(shape+(n_bins_max,))
+		self.sigma = self.sigma.reshape(shape+(n_bins_max,))
+		self.n_bins = self.n_bins.reshape(shape)
+
+	def _group(self,index,R,transit_file_path,star,cache,binning_mode,d,A_tel,tau,n_ints,t,noise_floor,\
+		binned_wavelength_min,binned_wavelength_max,mode,n_instance,rng,chunk_size,correlated=None,point_chunk_size=64):
+		"""
+		evaluate every grid point sharing the same R, parameters are broadcast
+		as columns against the binned wavelength grid
+		"""
+		binned_wavelength, L_star_bin, L_in_transit_bin = flux_cache.binned_luminosity('transit',transit_file_path,star,\
+			binned_wavelength_min,binned_wavelength_max,R,cache,binning_mode)
+
+		d = d[index,np.newaxis]
+		A_tel = A_tel[index,np.newaxis]
+		tau = tau[index,np.newaxis]
+		n_ints = n_ints[index,np.newaxis]
+		t = t[index,np.newaxis]
+		dilution = flux_dilution(d)
+		photon_eqn = BinnedTransitPhotonNumber.source_photon_number_eqn
+		n_star_bin = photon_eqn(binned_wavelength*1e-6,L_star_bin*dilution,R,tau,A_tel)*t
+		n_in_transit_bin = photon_eqn(binned_wavelength*1e-6,L_in_transit_bin*dilution,R,tau,A_tel)*t
+
+		n_background = BinnedJWSTBackgroundPhotonEnergy(binned_wavelength,R,t).n_background
+		detector_noise = DetectorNoise(binned_wavelength,R,n_ints)
+		sys_noise = SysNoise(binned_wavelength,noise_floor)
+
+		if mode == 'analytic':
+			star_noise_engine = NoiseEngine(n_star_bin,n_background,detector_noise,sys_noise)
+			in_transit_noise_engine = NoiseEngine(n_in_transit_bin,n_background,detector_noise,sys_noise)
+			mean_depth, sigma = ratio_moments(star_noise_engine.source,in_transit_noise_engine.source,\
+				star_noise_engine.sigma_total,in_transit_noise_engine.sigma_total,True)
+		elif mode == 'monte_carlo':
+			# a few grid points at a time bound the realization buffers
+			mean_depth = np.empty(n_star_bin.shape)
+			sigma = np.empty(n_star_bin.shape)
+			for start in range(0,len(index),point_chunk_size):
+				rows = slice(start,start+point_chunk_size)
+				detector_noise = DetectorNoise(binned_wavelength,R,n_ints[rows])
+				star_noise_engine = NoiseEngine(n_star_bin[rows],n_background[rows],detector_noise,sys_noise,rng,correlated)
+				in_transit_noise_engine = NoiseEngine(n_in_transit_bin[rows],n_background[rows],detector_noise,sys_noise,\
+					rng,correlated)
+				stats = simulate_ratio(star_noise_engine,in_transit_noise_engine,n_background[rows],\
+					n_instance,True,chunk_size)
+				mean_depth[rows], sigma[rows] = stats.mean, stats.sigma
+		else:
+			raise ValueError("mode must be 'monte_carlo' or 'analytic'")
+		return binned_wavelength, mean_depth, sigma
@@ -0,0 +1,42 @@
+import numpy as np
+import batch
+
+def write_transit(path,offset=0.):
+	wavelength = np.logspace(np.log10(30.),np.log10(0.5),2000)
+	np.savetxt(path,np.column_stack((wavelength,0.0104 + offset + 1e-4*np.sin(5*wavelength))))
+
+def make_jobs(path,**entries):
+	job = dict(kind='transit',file_path=path,d=5,A_tel=25,tau=0.5,R=100,noise_floor=[20e-6,30e-6,50e-6],\
+		binned_wavelength_min=2.,binned_wavelength_max=11.,n_ints=20,t=11000,n_instance=200,cache=False)
+	job.update(entries)
+	return job
+
+def test_seed_indices():
+	jobs = [dict(),dict(seed_group='a'),dict(),dict(seed_group='a'),dict(seed_group=0),dict(seed_group=0)]
+	assert batch.seed_indices(jobs) == [0,1,2,1,4,4]
+
+def test_seed_group_shares_the_noise(tmp_path):
+	path, other_path = str(tmp_path/'transit.txt'), str(tmp_path/'transit_b.txt')
+	write_transit(path)
+	write_transit(other_path,1e-5)
+	jobs = [make_jobs(path,seed_group='pair'),make_jobs(other_path),make_jobs(other_path,seed_group='pair'),\
+		make_jobs(path,seed_group='pair')]
+	table = batch.run_batch(jobs,n_workers=1,seed=3)
+	mean = [table['mean'][table['job'] == i] for i in range(len(jobs))]
+	sigma = table['sigma'][table['job'] == 0]
+	np.testing.assert_array_equal(mean[0],mean[3])
+	# the difference of the models is recovered without the sampling noise of either
+	common = mean[2] - mean[0] - 1e-5
+	independent = mean[1] - mean[0] - 1e-5
+	assert np.std(common) < 0.01*np.std(independent)
+	assert np.std(independent) > 0.5*np.mean(sigma)/np.sqrt(200)
+	# the first job of a group keeps the noise it has in a batch of its own
+	single = batch.run_batch(jobs[:1],n_workers=1,seed=3)
+	np.testing.assert_array_equal(single['mean'],mean[0])
+
+def test_job_rng_replaces_the_seed(tmp_path):
+	path = str(tmp_path/'transit.txt')
+	write_transit(path)
+	first = batch.run_batch([make_jobs(path,rng=7)],n_workers=1,seed=0)
+	second = batch.run_batch([make_jobs(path,rng=7)],n_workers=1,seed=1)
+	np.testing.assert_array_equal(first['mean'],second['mean'])
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from binned_photon_energy import Binning
+
+@pytest.fixture
+def wavelength():
+	# descending and irregular, as in the model atmosphere files
+	rng = np.random.default_rng(0)
+	return np.sort(np.exp(rng.uniform(np.log(0.5),np.log(30.),5000)))[::-1].copy()
+
+def test_average_conserves_the_flux(wavelength):
+	binning_obj = Binning(wavelength,2.,11.,100,'average')
+	flux = np.random.default_rng(1).lognormal(size=(3,wavelength.size))
+	binned = binning_obj.binning(flux)
+	# integral of the piecewise constant input over the binned range
+	order = np.argsort(wavelength)
+	edges = Binning.pixel_edges(wavelength[order])
+	binned_edges = np.exp(Binning.pixel_edges(np.log(binning_obj.binned_wavelength)))
+	overlap = np.clip(np.minimum(edges[1:],binned_edges[-1]) - np.maximum(edges[:-1],binned_edges[0]),0.,None)
+	np.testing.assert_allclose((binned*np.diff(binned_edges)).sum(axis=-1),flux[:,order].dot(overlap),rtol=1e-10)
+	np.testing.assert_allclose(binning_obj.binning(np.ones(wavelength.size)),1.,rtol=1e-12)
+
+def test_interpolate_is_exact_on_lines(wavelength):
+	binning_obj = Binning(wavelength,2.,11.,100,'interpolate')
+	np.testing.assert_allclose(binning_obj.binning(3*wavelength - 1),3*binning_obj.binned_wavelength - 1,rtol=1e-12)
+
+@pytest.mark.parametrize('bounds',[(0.5,11.),(2.,30.)])
+def test_average_rejects_partly_covered_bins(wavelength,bounds):
+	# the outer bins reach half a bin beyond the bounds, past the input grid
+	with pytest.raises(ValueError,match='beyond'):
+		Binning(wavelength,bounds[0],bounds[1],100,'average')
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from error_propagation import ratio_moments
+
+@pytest.mark.parametrize('transit',[True,False])
+def test_ratio_moments_against_monte_carlo(transit):
+	rng = np.random.default_rng(0)
+	n = 400000
+	# bright to faint signals, the faint ones have a visible second order bias
+	star = np.array([1e6,1e4,2e3])
+	planet = star*np.array([0.99,0.98,1.05])
+	background = np.array([1e3,5e2,1e2])
+	sigma_star = np.sqrt(star + background) + 0.05*star
+	sigma_planet = np.sqrt(planet + background) + 0.05*planet
+	noisy_star = star + background + sigma_star*rng.standard_normal((n,3))
+	noisy_planet = planet + background + sigma_planet*rng.standard_normal((n,3))
+	ratio = (noisy_planet - noisy_star)/(noisy_star - background)
+	if transit:
+		ratio = -ratio
+	mean, sigma = ratio_moments(star,planet,sigma_star,sigma_planet,transit)
+	first_order, first_sigma = ratio_moments(star,planet,sigma_star,sigma_planet,transit,order=1)
+	standard_error = ratio.std(axis=0)/np.sqrt(n)
+	assert np.all(np.abs(mean - ratio.mean(axis=0)) < 4*standard_error)
+	# the second order term is what brings the mean within the sampling noise
+	assert np.abs(first_order - ratio.mean(axis=0))[-1] > 10*standard_error[-1]
+	np.testing.assert_array_equal(sigma,first_sigma)
+	np.testing.assert_allclose(sigma,ratio.std(axis=0),rtol=0.02)
+
+def test_ratio_moments_order():
+	with pytest.raises(ValueError):
+		ratio_moments(1.,1.,1.,1.,True,order=3)
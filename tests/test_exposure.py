@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from exposure import noise_coefficients, variance, minimum_time, ExposureTime
+from error_propagation import ratio_moments
+from spectra import TransitSpectra
+
+def test_coefficients_match_the_delta_method():
+	rng = np.random.default_rng(0)
+	star, background, detector_variance = rng.uniform(1e3,1e7,(3,50))
+	planet = star*rng.uniform(0.9,1.1,50)
+	sys_ratio = rng.uniform(0.,1e-4,50)
+	A, B, C = noise_coefficients(star,planet,background,detector_variance,sys_ratio)
+	for t,n_ints in ((1.,1),(3600.,50),(1e5,1000)):
+		sigma = lambda source: np.sqrt((source + background)*t + detector_variance*n_ints + (sys_ratio*source*t)**2)
+		mean, sigma_ratio = ratio_moments(star*t,planet*t,sigma(star),sigma(planet),True)
+		np.testing.assert_allclose(variance(A,B,C,t,n_ints),sigma_ratio**2,rtol=1e-10)
+
+@pytest.mark.parametrize('B',[0.,1e-30,1e-3,10.])
+def test_minimum_time_round_trip(B):
+	A, C = 1e-4, 1e-14
+	sigma = np.array([1.5e-7,1e-6,1e-5,1e-3])
+	t = minimum_time(A,B,C,sigma,n_ints=20)
+	assert np.all(t > 0)
+	np.testing.assert_allclose(variance(A,B,C,t,n_ints=20),sigma**2,rtol=1e-10)
+	t = minimum_time(A,B,C,sigma,t_int=2.)
+	np.testing.assert_allclose(variance(A,B,C,t,t_int=2.),sigma**2,rtol=1e-10)
+	# the systematic floor is never beaten
+	assert np.all(np.isinf(minimum_time(A,B,C,np.array([0.,1e-7,0.5e-7]),n_ints=20)))
+
+def test_minimum_time_arguments():
+	with pytest.raises(ValueError):
+		minimum_time(1.,1.,0.,1e-3)
+	with pytest.raises(ValueError):
+		variance(1.,1.,0.,1.,n_ints=1,t_int=1.)
+
+def test_exposure_time_matches_the_spectra(tmp_path):
+	wavelength = np.logspace(np.log10(30.),np.log10(0.5),2000)
+	depth = 0.0104 + 1e-4*np.sin(5*wavelength)
+	path = str(tmp_path/'transit.txt')
+	np.savetxt(path,np.column_stack((wavelength,depth)))
+	noise_floor = [20e-6,30e-6,50e-6]
+	spectra = TransitSpectra()
+	spectra.Compute(path,5,25,0.5,100,noise_floor,2.,11.,20,11000,10,mode='analytic',cache=False)
+	exposure = ExposureTime()
+	exposure.Compute('transit',wavelength,depth,5,25,0.5,100,noise_floor,2.,11.)
+	np.testing.assert_allclose(exposure.Sigma(11000,n_ints=20)[0],spectra.sigma,rtol=1e-12)
+	# the first order depth, without the second order bias of the spectra
+	np.testing.assert_allclose(exposure.mean[0],spectra.mean_depth,rtol=1e-5)
+	np.testing.assert_allclose(exposure.MinimumTime(sigma=spectra.sigma,n_ints=20)[0],11000,rtol=1e-10)
@@ -0,0 +1,22 @@
+import hashlib
+import os
+import flux_cache
+
+def test_file_hash_follows_the_file(tmp_path):
+	path = str(tmp_path/'spectra.txt')
+	for i,content in enumerate([b'1 2\n',b'1 2\n3 4\n',b'5 6\n7 8\n']):
+		with open(path,'wb') as f:
+			f.write(content)
+		# same size as the previous content, only the modification time differs
+		os.utime(path,ns=(i*10**9,i*10**9))
+		assert flux_cache.file_hash(path) == hashlib.sha1(content).hexdigest()
+	assert list(flux_cache._file_hashes).count(os.path.abspath(path)) == 1
+
+def test_file_hashes_are_bounded(tmp_path,monkeypatch):
+	monkeypatch.setattr(flux_cache,'_file_hashes_size',3)
+	for i in range(10):
+		path = str(tmp_path/('%d.txt' % i))
+		with open(path,'w') as f:
+			f.write('%d\n' % i)
+		flux_cache.file_hash(path)
+	assert len(flux_cache._file_hashes) <= 3
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from noise_engine import CovarianceNoise, PowerSpectrumNoise, power_law
+
+def squared_exponential(n,length,amplitude=1.):
+	k = np.arange(n)
+	return amplitude*np.exp(-0.5*((k[:,np.newaxis] - k)/length)**2)
+
+@pytest.mark.parametrize('rank',[None,3])
+def test_covariance_noise(rank):
+	n = 40
+	correlation = squared_exponential(n,4.)
+	noise = CovarianceNoise(correlation*(3e-5)**2,rank)
+	x = noise.sample(np.random.default_rng(0),(200000,n))
+	assert x.shape == (200000,n)
+	# the residual keeps unit variance in every bin whatever the rank
+	np.testing.assert_allclose(np.var(x,axis=0),1.,atol=0.02)
+	empirical = np.corrcoef(x,rowvar=False)
+	if rank is None:
+		assert noise.rank < n
+		np.testing.assert_allclose(empirical,correlation,atol=0.02)
+	else:
+		# the modes left out only lose off diagonal correlation
+		kept = noise.factor.dot(noise.factor.T)
+		np.fill_diagonal(kept,1.)
+		np.testing.assert_allclose(empirical,kept,atol=0.02)
+
+@pytest.mark.parametrize('pad',[True,False])
+def test_power_spectrum_noise(pad):
+	n = 64
+	noise = PowerSpectrumNoise(n,power_law(1.5),pad)
+	x = noise.sample(np.random.default_rng(1),(100000,n))
+	assert x.shape == (100000,n)
+	# autocovariance of the stationary process of period n_fft with this power spectrum
+	frequency = np.fft.rfftfreq(noise.n_fft)
+	power = power_law(1.5)(frequency)
+	weight = np.full(frequency.size,2.)
+	weight[0] = 1.
+	if noise.n_fft % 2 == 0:
+		weight[-1] = 1.
+	lag = np.arange(n)
+	autocovariance = (weight*power*np.cos(2*np.pi*np.outer(lag,frequency))).sum(axis=1)/(weight*power).sum()
+	expected = autocovariance[np.abs(lag[:,np.newaxis] - lag)]
+	np.testing.assert_allclose(np.var(x,axis=0),1.,atol=0.03)
+	np.testing.assert_allclose(np.cov(x,rowvar=False),expected,atol=0.03)
+
+def test_white_power_spectrum_noise():
+	noise = PowerSpectrumNoise(32,lambda frequency: np.ones_like(frequency))
+	x = noise.sample(np.random.default_rng(2),(100000,32))
+	np.testing.assert_allclose(np.cov(x,rowvar=False),np.eye(32),atol=0.02)
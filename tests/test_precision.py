@@ -0,0 +1,45 @@
+import warnings
+import numpy as np
+import pytest
+from spectra import TransitSpectra
+
+def write_transit(path):
+	wavelength = np.logspace(np.log10(30.),np.log10(0.5),2000)
+	np.savetxt(path,np.column_stack((wavelength,0.0104 + 1e-4*np.sin(5*wavelength))))
+
+def compute(path,dtype,bright=False):
+	spectra = TransitSpectra()
+	if bright:
+		# huge photon numbers without a noise floor, the ratio needs more than float32 digits
+		spectra.Compute(path,1.,1e4,0.5,10,[0.,0.,0.,0.],2.,11.,20,1e6,2000,rng=1,cache=False,dtype=dtype)
+	else:
+		spectra.Compute(path,5,25,0.5,100,[20e-6,30e-6,50e-6],2.,11.,20,11000,4000,rng=1,cache=False,dtype=dtype)
+	return spectra
+
+def test_float32_close_to_float64(tmp_path):
+	path = str(tmp_path/'transit.txt')
+	write_transit(path)
+	with warnings.catch_warnings():
+		warnings.simplefilter('error',RuntimeWarning)
+		reduced = compute(path,np.float32)
+	exact = compute(path,np.float64)
+	assert reduced.mean_depth.dtype == np.float64
+	# float32 deviates come from another random stream, both estimates agree within their sampling noise
+	standard_error = exact.sigma/np.sqrt(4000)
+	assert np.max(np.abs(reduced.mean_depth - exact.mean_depth)/standard_error) < 6
+	np.testing.assert_allclose(reduced.sigma,exact.sigma,rtol=0.1)
+
+def test_float32_falls_back_to_float64(tmp_path):
+	path = str(tmp_path/'transit.txt')
+	write_transit(path)
+	with pytest.warns(RuntimeWarning,match='falling back to float64'):
+		reduced = compute(path,np.float32,bright=True)
+	exact = compute(path,np.float64,bright=True)
+	np.testing.assert_array_equal(reduced.mean_depth,exact.mean_depth)
+	np.testing.assert_array_equal(reduced.sigma,exact.sigma)
+
+def test_unknown_dtype(tmp_path):
+	path = str(tmp_path/'transit.txt')
+	write_transit(path)
+	with pytest.raises(ValueError,match='dtype'):
+		compute(path,np.float16)
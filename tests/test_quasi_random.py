@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from scipy.special import ndtri
+from noise_engine import QuasiRandomStream, QMC_MAX_DIMENSION
+
+@pytest.mark.parametrize('sampling',['sobol','halton'])
+def test_columns_of_shared_stream_are_independent(sampling):
+	n, length = 4096, 20
+	stream = QuasiRandomStream(sampling,np.random.default_rng(0))
+	star_offset, planet_offset = stream.add(length), stream.add(length)
+	blocks = []
+	for i in range(3):
+		# draws alternate between the engines as in simulate_ratio
+		star = ndtri(stream.random(n,star_offset,length))
+		planet = ndtri(stream.random(n,planet_offset,length))
+		blocks.append((star,planet))
+		correlation = np.corrcoef(star,planet,rowvar=False)[:length,length:]
+		assert np.max(np.abs(correlation)) < 5/np.sqrt(n)
+		assert not np.any(np.isclose(star,planet).all(axis=0))
+		# the quasi random points balance the mean far better than random ones
+		assert np.max(np.abs(star.mean(axis=0))) < 0.5/np.sqrt(n)
+	# every call continues the sequence instead of repeating points
+	assert not np.allclose(blocks[0][0],blocks[1][0])
+	all_star = np.concatenate([star for star,planet in blocks])
+	assert np.max(np.abs(np.corrcoef(all_star,rowvar=False) - np.eye(length))) < 5/np.sqrt(len(all_star))
+
+def test_stream_dimensions():
+	stream = QuasiRandomStream('sobol',np.random.default_rng(0))
+	assert stream.add(5) == 0
+	assert stream.add(7) == 5
+	stream.random(16,0,5)
+	with pytest.raises(ValueError):
+		stream.add(1)
+	with pytest.raises(ValueError,match='dimensions'):
+		QuasiRandomStream('halton',None).add(QMC_MAX_DIMENSION['halton'] + 1)
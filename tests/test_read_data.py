@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+import read_data
+
+def write_spectra(path,n_comments,n_rows):
+	with open(path,'w') as f:
+		for i in range(n_comments):
+			f.write('# header line %d\n' % i)
+		for i in range(n_rows):
+			f.write('%.17g %.17g\n' % (1. + 0.1*i,1e-2 + 1e-5*i))
+
+@pytest.mark.parametrize('n_threads',[1,3,8,64])
+def test_parse_text_comment_only_pieces(tmp_path,n_threads):
+	path = str(tmp_path/'spectra.txt')
+	write_spectra(path,20,10)
+	expected = np.loadtxt(path,comments='#',usecols=(0,1),unpack=True)
+	columns = read_data.parse_text(path,n_threads)
+	assert columns.shape == (2,10)
+	np.testing.assert_array_equal(columns,expected)
+
+def test_parse_text_only_comments(tmp_path):
+	path = str(tmp_path/'spectra.txt')
+	write_spectra(path,5,0)
+	assert read_data.parse_text(path,4).shape == (2,0)
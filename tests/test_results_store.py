@@ -0,0 +1,41 @@
+import json
+import os
+import numpy as np
+import pytest
+from results_store import ResultsStore
+
+def spectra_rows(n):
+	rows = []
+	for i in range(n):
+		binned_wavelength = np.linspace(2.,11.,10+i)
+		rows.append(('transit','model_%d.txt' % i,dict(d=5.+i,R=100,note='\n%d' % i),binned_wavelength,\
+			0.01 + 1e-4*binned_wavelength,1e-5*np.ones_like(binned_wavelength),None))
+	return rows
+
+@pytest.mark.parametrize('compression',[None,'zlib'])
+def test_round_trip(tmp_path,compression):
+	path = str(tmp_path/'store')
+	rows = spectra_rows(7)
+	store = ResultsStore(path,compression)
+	store.extend(rows[:3])
+	store.extend(rows[3:])
+	store = ResultsStore(path)
+	assert len(store) == 7
+	assert store.column('file_path',2,5) == ['model_2.txt','model_3.txt','model_4.txt']
+	for i,(kind,file_path,parameters,binned_wavelength,mean,sigma,realizations) in enumerate(rows):
+		assert store.parameters(i) == parameters
+		np.testing.assert_array_equal(store.spectrum(i)[0],binned_wavelength)
+		np.testing.assert_array_equal(store.spectrum(i)[1],mean)
+	np.testing.assert_array_equal(store.column('d'),5. + np.arange(7))
+
+def test_unknown_format(tmp_path):
+	path = str(tmp_path/'store')
+	ResultsStore(path).extend(spectra_rows(2))
+	meta_path = os.path.join(path,'meta.json')
+	with open(meta_path) as f:
+		meta = json.load(f)
+	del meta['format']
+	with open(meta_path,'w') as f:
+		json.dump(meta,f)
+	with pytest.raises(ValueError,match='format'):
+		ResultsStore(path)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from scipy import stats
+from running_stats import RunningStatistics
+
+def check_moments(running,i,samples):
+	"""
+	compare the accumulated moments of element i with numpy and scipy
+	"""
+	n = np.broadcast_to(running.n,running.mean.shape)[i]
+	variance = running.variance[i]
+	assert n == len(samples)
+	np.testing.assert_allclose(running.mean[i],np.mean(samples),rtol=1e-12)
+	np.testing.assert_allclose(variance,np.var(samples),rtol=1e-9)
+	np.testing.assert_allclose(running.m3[i]/n/variance**1.5,stats.skew(samples),rtol=1e-6)
+	np.testing.assert_allclose(running.m4[i]/n/variance**2,stats.kurtosis(samples,fisher=False),rtol=1e-8)
+
+@pytest.fixture(scope='module')
+def samples():
+	rng = np.random.default_rng(0)
+	# skewed, far from zero and with more than 2**21 samples, where cubes of int64 counts overflow
+	return 1e3 + rng.exponential(2.,size=(3*2**20 + 12345,3))
+
+def test_chunked_merge(samples):
+	running = RunningStatistics(kurtosis=True)
+	for start in range(0,len(samples),2**19 + 7):
+		running.update(samples[start:start + 2**19 + 7])
+	assert running.n > 2**21
+	for i in range(3):
+		check_moments(running,i,samples[:,i])
+
+def test_per_index_merge(samples):
+	running = RunningStatistics(kurtosis=True)
+	running.update(samples[:1000])
+	# element 0 takes every chunk, 1 every other and 2 only the last one
+	used = [[slice(0,1000)] for i in range(3)]
+	bounds = [1000,2**20,2**21,2**21 + 2**20,len(samples)]
+	for k,(start,stop) in enumerate(zip(bounds[:-1],bounds[1:])):
+		index = [i for i in range(3) if i == 0 or (i == 1 and k % 2 == 0) or (i == 2 and stop == len(samples))]
+		running.update(samples[start:stop][:,index],index)
+		for i in index:
+			used[i].append(slice(start,stop))
+	for i in range(3):
+		check_moments(running,i,np.concatenate([samples[chunk,i] for chunk in used[i]]))
+	assert running.n[0] == len(samples) > 2**21
+
+def test_percentiles_beyond_the_first_chunk():
+	rng = np.random.default_rng(1)
+	# the first chunk is far narrower than the later ones on both sides
+	samples = np.concatenate([rng.normal(0.,0.01,(1000,2)),rng.normal(0.,1.,(100000,2)) + [0.,3.]])
+	running = RunningStatistics(percentiles=[5,50,95])
+	for start in range(0,len(samples),1000):
+		running.update(samples[start:start+1000])
+	for q in (5,50,95):
+		expected = np.percentile(samples,q,axis=0)
+		np.testing.assert_allclose(running.percentile(q),expected,atol=0.02)
+	assert running.hist.sum(axis=-1).tolist() == [len(samples)]*2
+
+def test_percentiles_of_per_index_merges():
+	rng = np.random.default_rng(2)
+	running = RunningStatistics(percentiles=[10,90],n_hist=256)
+	first = rng.normal(0.,1.,(500,3))
+	later = rng.normal(10.,1.,(50000,1))
+	running.update(first)
+	running.update(later,[1])
+	np.testing.assert_allclose(running.percentile(90)[1],np.percentile(np.concatenate([first[:,1],later[:,0]]),90),\
+		atol=0.2)
+	np.testing.assert_allclose(running.percentile(90)[[0,2]],np.percentile(first[:,[0,2]],90,axis=0),atol=0.1)
+	with pytest.raises(ValueError):
+		RunningStatistics(percentiles=[50],n_hist=255)
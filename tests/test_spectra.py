@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from spectra import TransitSpectra
+
+def write_transit(path):
+	wavelength = np.logspace(np.log10(30.),np.log10(0.5),2000)
+	np.savetxt(path,np.column_stack((wavelength,0.0104 + 1e-4*np.sin(5*wavelength))))
+
+def compute(path,**kwargs):
+	spectra = TransitSpectra()
+	spectra.Compute(path,5,25,0.5,100,[20e-6,30e-6,50e-6],2.,11.,20,11000,kwargs.pop('n_instance',2000),\
+		rng=0,cache=False,**kwargs)
+	return spectra
+
+@pytest.mark.parametrize('sampling',['antithetic','sobol','halton'])
+def test_adaptive_needs_random_sampling(tmp_path,sampling):
+	path = str(tmp_path/'transit.txt')
+	write_transit(path)
+	with pytest.raises(ValueError,match='random'):
+		compute(path,mode='adaptive',sampling=sampling)
+
+def test_adaptive_random_sampling(tmp_path):
+	path = str(tmp_path/'transit.txt')
+	write_transit(path)
+	spectra = compute(path,mode='adaptive',rtol=0.1)
+	analytic = compute(path,mode='analytic')
+	assert spectra.converged.all()
+	np.testing.assert_allclose(spectra.sigma,analytic.sigma,rtol=0.5)
@@ -0,0 +1,32 @@
+import numpy as np
+import flux_cache
+from star import Star
+from spectra import TransitSpectra
+
+def write_transit(path):
+	wavelength = np.logspace(np.log10(30.),np.log10(0.5),2000)
+	np.savetxt(path,np.column_stack((wavelength,0.0104 + 1e-4*np.sin(5*wavelength))))
+
+def test_key_of_array_stars():
+	star = Star(T=np.array([5000.,6000.]),R=np.array([6e8,7e8]))
+	same = Star(T=[5000.,6000.],R=np.array([6e8,7e8]))
+	other = Star(T=np.array([5000.,6100.]),R=np.array([6e8,7e8]))
+	hash(star.key())
+	assert star.key() == same.key()
+	assert star.key() != other.key()
+	assert Star(T=5000,R=6e8).key() == (5000.,6e8)
+
+def test_cached_compute_of_array_stars(tmp_path):
+	path = str(tmp_path/'transit.txt')
+	write_transit(path)
+	cache = flux_cache.LRUCache()
+	sigma = []
+	for T in ([5000.,6000.],[5000.,6000.],[5500.,6000.]):
+		spectra = TransitSpectra()
+		spectra.Compute(path,5,25,0.5,100,[20e-6,30e-6,50e-6],2.,11.,20,11000,100,\
+			mode='analytic',cache=cache,star=Star(T=np.array(T),R=np.array([6e8,7e8])))
+		sigma.append(spectra.sigma)
+	assert sigma[0].shape == (2,len(spectra.binned_wavelength))
+	np.testing.assert_array_equal(sigma[0],sigma[1])
+	np.testing.assert_array_equal(sigma[0][1],sigma[2][1])
+	assert not np.allclose(sigma[0][0],sigma[2][0])